@@ -0,0 +1,271 @@
+"""Cluster benchmark
+
+Starts N raftos nodes as local processes, runs a configurable load against the leader
+and reports throughput, commit latency percentiles, leader failover and catch-up time as JSON.
+
+    python benchmarks/cluster.py --nodes 3 --operations 5000 --concurrency 16 --value-size 256
+    python benchmarks/cluster.py --nodes 5 --read-ratio 0.5 --failover --output results.json
+"""
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import string
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from multiprocessing import Process, Queue
+from queue import Empty
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import raftos  # noqa: E402
+from raftos.server import Node  # noqa: E402
+from raftos.state import State  # noqa: E402
+
+
+RESULTS_FORMAT_VERSION = 1
+
+
+def percentile(samples, percent):
+    """Nearest-rank percentile of already sorted samples"""
+    if not samples:
+        return None
+
+    rank = max(int(round(percent / 100 * len(samples) + 0.5)) - 1, 0)
+    return samples[min(rank, len(samples) - 1)]
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    return {
+        'count': len(latencies),
+        'mean': sum(latencies) / len(latencies) if latencies else None,
+        'p50': percentile(latencies, 50),
+        'p99': percentile(latencies, 99),
+        'p999': percentile(latencies, 99.9),
+        'max': latencies[-1] if latencies else None
+    }
+
+
+def node_process(node, cluster, log_dir, events, commands):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    raftos.configure({
+        'log_path': log_dir,
+        'serializer': raftos.serializers.JSONSerializer,
+        'on_leader': lambda: events.put(('leader', node, time.time()))
+    })
+
+    loop.run_until_complete(raftos.register(node, cluster=cluster, loop=loop))
+    events.put(('started', node, time.time()))
+    loop.run_until_complete(serve(loop, node, events, commands))
+
+
+async def serve(loop, node, events, commands):
+    while True:
+        command, params = await loop.run_in_executor(None, commands.get)
+
+        if command == 'load':
+            result = await run_load(**params)
+            events.put(('load_result', node, result))
+
+        elif command == 'catch_up':
+            await wait_applied(params['index'])
+            events.put(('caught_up', node, time.time()))
+
+        elif command == 'stop':
+            return
+
+
+async def wait_applied(index):
+    log = Node.nodes[0].state.log
+    while log.last_applied < index:
+        await asyncio.sleep(0.01)
+
+
+async def run_load(operations, concurrency, value_size, read_ratio, keys, seed):
+    rnd = random.Random(seed)
+    value = ''.join(rnd.choice(string.ascii_letters) for _ in range(value_size))
+    latencies = {'read': [], 'write': []}
+    errors = []
+    remaining = [operations]
+
+    # Make sure every key we may read exists
+    for key in range(keys):
+        await State.set_value('key-{}'.format(key), value)
+
+    async def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            key = 'key-{}'.format(rnd.randrange(keys))
+            kind = 'read' if rnd.random() < read_ratio else 'write'
+
+            started = time.perf_counter()
+            try:
+                if kind == 'read':
+                    await State.get_value(key)
+                else:
+                    await State.set_value(key, value)
+            except Exception as exc:
+                errors.append(repr(exc))
+            else:
+                latencies[kind].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    completed = len(latencies['read']) + len(latencies['write'])
+    return {
+        'operations': completed,
+        'errors': len(errors),
+        'error_samples': errors[:10],
+        'elapsed': elapsed,
+        'ops_per_sec': completed / elapsed if elapsed else None,
+        'write_latency': summarize(latencies['write']),
+        'read_latency': summarize(latencies['read']),
+        'commit_index': Node.nodes[0].state.log.commit_index
+    }
+
+
+class Cluster:
+    def __init__(self, size, start_port, log_dir):
+        self.log_dir = log_dir
+        self.nodes = ['127.0.0.1:{}'.format(start_port + i) for i in range(size)]
+        self.events = Queue()
+        self.commands = {}
+        self.processes = {}
+
+    def start(self, node):
+        self.commands[node] = Queue()
+        cluster = [neighbour for neighbour in self.nodes if neighbour != node]
+        process = Process(
+            target=node_process,
+            args=(node, cluster, self.log_dir, self.events, self.commands[node])
+        )
+        process.start()
+        self.processes[node] = process
+
+    def kill(self, node):
+        process = self.processes.pop(node)
+        process.terminate()
+        process.join()
+
+    def stop(self):
+        for node, process in self.processes.items():
+            process.terminate()
+            process.join()
+
+    def send(self, node, command, **params):
+        self.commands[node].put((command, params))
+
+    def wait_for(self, kind, timeout, node=None, exclude=()):
+        deadline = time.time() + timeout
+        while True:
+            try:
+                event = self.events.get(timeout=max(deadline - time.time(), 0))
+            except Empty:
+                raise TimeoutError('No {} event in {}s'.format(kind, timeout))
+
+            if event[0] != kind or event[1] in exclude:
+                continue
+
+            if node is None or event[1] == node:
+                return event
+
+
+def run(args):
+    log_dir = args.log_dir or tempfile.mkdtemp(prefix='raftos-benchmark-')
+    cluster = Cluster(args.nodes, args.start_port, log_dir)
+
+    results = {
+        'format_version': RESULTS_FORMAT_VERSION,
+        'python': platform.python_version(),
+        'timestamp': time.time(),
+        'params': vars(args)
+    }
+
+    try:
+        started = time.time()
+        for node in cluster.nodes:
+            cluster.start(node)
+
+        _, leader, elected = cluster.wait_for('leader', timeout=args.timeout)
+        results['election_time'] = elected - started
+        results['leader'] = leader
+
+        if args.failover:
+            # This follower misses the whole load and has to catch up afterwards
+            lagging = next(node for node in cluster.nodes if node != leader)
+            cluster.kill(lagging)
+
+        cluster.send(
+            leader, 'load',
+            operations=args.operations,
+            concurrency=args.concurrency,
+            value_size=args.value_size,
+            read_ratio=args.read_ratio,
+            keys=args.keys,
+            seed=args.seed
+        )
+        results['load'] = cluster.wait_for('load_result', timeout=args.timeout)[2]
+
+        if args.failover:
+            # Restart the lagging follower and measure how long it takes to apply everything committed
+            restarted_at = time.time()
+            cluster.start(lagging)
+            cluster.wait_for('started', timeout=args.timeout, node=lagging)
+            cluster.send(lagging, 'catch_up', index=results['load']['commit_index'])
+            _, _, caught_up = cluster.wait_for('caught_up', timeout=args.timeout, node=lagging)
+
+            killed_at = time.time()
+            cluster.kill(leader)
+
+            _, new_leader, elected = cluster.wait_for('leader', timeout=args.timeout, exclude=(leader,))
+            results['failover'] = {
+                'old_leader': leader,
+                'new_leader': new_leader,
+                'failover_time': elected - killed_at,
+                'lagging_follower': lagging,
+                'catch_up_index': results['load']['commit_index'],
+                'catch_up_time': caught_up - restarted_at
+            }
+
+    finally:
+        cluster.stop()
+        if not args.log_dir:
+            shutil.rmtree(log_dir, ignore_errors=True)
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='raftos cluster benchmark')
+
+    parser.add_argument('-n', '--nodes', help='Cluster size', type=int, default=3)
+    parser.add_argument('-p', '--start-port', help='Start port', type=int, default=9000)
+    parser.add_argument('-o', '--operations', help='Total operations', type=int, default=1000)
+    parser.add_argument('-c', '--concurrency', help='Concurrent clients', type=int, default=8)
+    parser.add_argument('-s', '--value-size', help='Value size in bytes', type=int, default=128)
+    parser.add_argument('-r', '--read-ratio', help='Share of reads [0, 1]', type=float, default=0.0)
+    parser.add_argument('-k', '--keys', help='Keyspace size', type=int, default=100)
+    parser.add_argument('--seed', help='Random seed', type=int, default=0)
+    parser.add_argument('--failover', help='Stop a follower during the load and measure its catch-up, '
+                                           'then kill the leader and measure failover', action='store_true')
+    parser.add_argument('--timeout', help='Timeout for every phase', type=float, default=60)
+    parser.add_argument('--log-dir', help='Keep node data in this dir', default=None)
+    parser.add_argument('--output', help='Write JSON results to a file instead of stdout')
+
+    args = parser.parse_args()
+    results = run(args)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
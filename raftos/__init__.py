@@ -1,23 +1,41 @@
 from .conf import configure, config
-from .replicator import Replicated, ReplicatedDict, ReplicatedList
+from .replicator import (
+    Replicated, ReplicatedCounter, ReplicatedDict, ReplicatedList, ReplicatedLock, ReplicatedQueue, ReplicatedSet,
+    Transaction
+)
 from .server import register, stop
 from .state import State
 
 
 __all__ = [
     'Replicated',
+    'ReplicatedCounter',
     'ReplicatedDict',
     'ReplicatedList',
+    'ReplicatedLock',
+    'ReplicatedQueue',
+    'ReplicatedSet',
+    'Transaction',
 
     'config',
     'configure',
     'register',
     'stop',
 
+    'backup',
+    'bulk_load',
     'get_leader',
-    'wait_until_leader'
+    'restore',
+    'scan',
+    'wait_until_leader',
+    'watch'
 ]
 
 
+backup = State.backup
+bulk_load = State.bulk_load
 get_leader = State.get_leader
+restore = State.restore
+scan = State.scan
 wait_until_leader = State.wait_until_leader
+watch = State.watch
@@ -0,0 +1,447 @@
+import bisect
+import os
+import sqlite3
+
+
+class BaseBackend:
+    """Storage of State Machine names (with values & versions) and meta (checkpoint, clock etc.)
+
+    Changes are staged with set() and saved together with meta by commit(),
+    staged changes are visible to reads right away.
+    Names are strings, scan() returns them in order.
+    State Machine records which change a few at a time are kept in TABLES, apart from meta
+    """
+
+    # Client sessions {client_id: session}, TTLs {name: <clock when it expires>}, locks {name: lock}
+    TABLES = ('sessions', 'expiry', 'locks')
+
+    def __init__(self, filename, config):
+        self.filename = filename
+        self.config = config
+
+    def load(self):
+        """Saved meta ({} on the first start)"""
+        raise NotImplementedError
+
+    def get(self, name):
+        """Value, raise KeyError if name is not set"""
+        raise NotImplementedError
+
+    def version(self, name):
+        """Index of the log entry that changed name last (0 if name is not set)"""
+        raise NotImplementedError
+
+    def set(self, updates, deletes, index):
+        """Stage changes, versions of updated names become index (unchanged if index is None)"""
+        raise NotImplementedError
+
+    def commit(self, meta):
+        raise NotImplementedError
+
+    def records(self, table):
+        """Saved records of table {key: value}"""
+        raise NotImplementedError
+
+    def set_records(self, table, updates, deletes):
+        """Stage changed & deleted records of table, saved by commit()"""
+        raise NotImplementedError
+
+    def stage(self, load_id, items):
+        """Add [name, value] pairs to bulk load load_id, saved by commit()
+        Returns amount of names which were not in the load before
+        """
+        raise NotImplementedError
+
+    def staged(self, load_id):
+        """Names of bulk load load_id {name: value}"""
+        raise NotImplementedError
+
+    def load_changes(self, load_id, replace):
+        """Changes bulk load load_id is going to make, a page at a time: [(updates, deletes), ...]
+        Args:
+            replace — names which were not loaded are deleted
+        """
+        raise NotImplementedError
+
+    def commit_load(self, load_id, index, replace):
+        """Move names of bulk load load_id into data with version index and forget the load, saved by commit()"""
+        raise NotImplementedError
+
+    def unstage(self, load_id):
+        """Forget bulk load load_id, saved by commit()"""
+        raise NotImplementedError
+
+    def scan(self, start=None, end=None, limit=None):
+        """[(name, value), ...] ordered by name, start <= name < end"""
+        raise NotImplementedError
+
+    def names(self):
+        raise NotImplementedError
+
+    def snapshot(self):
+        """Consistent copy of committed data with len() and items(), not affected by later changes"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def _pack(self, data):
+        return self.config.compressor.pack(self.config.serializer.pack(data))
+
+    def _unpack(self, data):
+        return self.config.serializer.unpack(self.config.compressor.unpack_stored(data))
+
+
+class MemoryBackend(BaseBackend):
+    """Everything is kept in memory, names are ordered by a sorted list (bisect)
+    File is rewritten as a whole on every commit:
+        {'data': {name: value, ...}, 'meta': {'versions': {name: version, ...}, 'staged': {...}, <table>: {...}, ...}}
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.data = {}
+        self.versions = {}
+        self.keys = []
+        self.tables = {table: {} for table in self.TABLES}
+        self.loads = {}
+
+    def load(self):
+        try:
+            with open(self.filename, 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            content = b''
+
+        self.data, meta = self._unwrap(self._unpack(content) if content else {})
+        self.versions = meta.pop('versions', {})
+        # Older versions kept expiry & locks in meta in the same format
+        self.tables = {table: meta.pop(table, {}) for table in self.TABLES}
+        self.loads = meta.pop('staged', {}) if 'loads' in meta else {}
+        self.keys = sorted(self.data)
+        return meta
+
+    @staticmethod
+    def _unwrap(content):
+        """Split file content into data & meta
+        State Machines written before checkpoints were introduced contain data only
+        """
+        if set(content) == {'data', 'meta'}:
+            return content['data'], content['meta']
+
+        return content, {}
+
+    def get(self, name):
+        return self.data[name]
+
+    def version(self, name):
+        return self.versions.get(name, 0)
+
+    def set(self, updates, deletes, index):
+        for name, value in updates.items():
+            if name not in self.data:
+                bisect.insort(self.keys, name)
+            self.data[name] = value
+
+            if index is not None:
+                self.versions[name] = index
+
+        for name in deletes:
+            if name in self.data:
+                del self.data[name]
+                del self.keys[bisect.bisect_left(self.keys, name)]
+            self.versions.pop(name, None)
+
+    def commit(self, meta):
+        """Write to a temporary file and rename it so a crash never leaves a half-written file"""
+        temporary = '{}.tmp'.format(self.filename)
+        with open(temporary, 'wb') as f:
+            f.write(self._pack({
+                'data': self.data,
+                'meta': dict(meta, versions=self.versions, staged=self.loads, **self.tables)
+            }))
+
+        os.replace(temporary, self.filename)
+
+    def records(self, table):
+        return dict(self.tables[table])
+
+    def set_records(self, table, updates, deletes):
+        self.tables[table].update(updates)
+        for key in deletes:
+            self.tables[table].pop(key, None)
+
+    def stage(self, load_id, items):
+        staged = self.loads.setdefault(load_id, {})
+        added = sum(1 for name, _ in items if name not in staged)
+        staged.update(items)
+        return added
+
+    def staged(self, load_id):
+        return dict(self.loads.get(load_id, {}))
+
+    def load_changes(self, load_id, replace):
+        """Staged names are in memory anyway: a single page"""
+        staged = self.loads.get(load_id, {})
+        yield staged, [name for name in self.keys if name not in staged] if replace else []
+
+    def commit_load(self, load_id, index, replace):
+        for updates, deletes in self.load_changes(load_id, replace):
+            self.set(updates, deletes, index)
+
+        self.unstage(load_id)
+
+    def unstage(self, load_id):
+        self.loads.pop(load_id, None)
+
+    def scan(self, start=None, end=None, limit=None):
+        first = bisect.bisect_left(self.keys, start) if start is not None else 0
+        last = bisect.bisect_left(self.keys, end) if end is not None else len(self.keys)
+        if limit is not None:
+            last = min(last, first + limit)
+
+        return [(name, self.data[name]) for name in self.keys[first:last]]
+
+    def names(self):
+        return iter(self.keys)
+
+    def snapshot(self):
+        """Values are never changed in place so a shallow copy is consistent"""
+        return dict(self.data)
+
+
+class SQLiteBackend(BaseBackend):
+    """Names are kept on disk in an SQLite database, only the pages in use are in memory
+    Write-ahead log lets snapshots read committed data while new changes are applied
+    """
+
+    # Amount of names read from disk at once by snapshots
+    PAGE_SIZE = 1000
+
+    # Key columns of TABLES
+    KEYS = {
+        'sessions': 'client_id',
+        'expiry': 'name',
+        'locks': 'name'
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Transactions are managed explicitly: changes of a command are committed together with meta
+        self.connection = sqlite3.connect(self.filename, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS data '
+            '(name TEXT PRIMARY KEY, value BLOB, version INTEGER) WITHOUT ROWID'
+        )
+        self.connection.execute('CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY, value BLOB)')
+        for table in self.TABLES:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS {} ({} TEXT PRIMARY KEY, value BLOB) WITHOUT ROWID'.format(
+                    table, self.KEYS[table]
+                )
+            )
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS staged '
+            '(load_id TEXT, name TEXT, value BLOB, PRIMARY KEY (load_id, name)) WITHOUT ROWID'
+        )
+
+    def load(self):
+        row = self.connection.execute('SELECT value FROM meta WHERE id = 0').fetchone()
+        return self._unpack(row[0]) if row else {}
+
+    def get(self, name):
+        row = self.connection.execute('SELECT value FROM data WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+
+        return self._unpack(row[0])
+
+    def version(self, name):
+        row = self.connection.execute('SELECT version FROM data WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else 0
+
+    def set(self, updates, deletes, index):
+        if not self.connection.in_transaction:
+            self.connection.execute('BEGIN')
+
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO data (name, value, version) '
+            'VALUES (?, ?, COALESCE(?, (SELECT version FROM data WHERE name = ?), 0))',
+            ((name, self._pack(value), index, name) for name, value in updates.items())
+        )
+        self.connection.executemany('DELETE FROM data WHERE name = ?', ((name,) for name in deletes))
+
+    def commit(self, meta):
+        if not self.connection.in_transaction:
+            self.connection.execute('BEGIN')
+
+        self.connection.execute('INSERT OR REPLACE INTO meta (id, value) VALUES (0, ?)', (self._pack(meta),))
+        self.connection.execute('COMMIT')
+
+    def records(self, table):
+        return {
+            key: self._unpack(value)
+            for key, value in self.connection.execute('SELECT {}, value FROM {}'.format(self.KEYS[table], table))
+        }
+
+    def set_records(self, table, updates, deletes):
+        if not self.connection.in_transaction:
+            self.connection.execute('BEGIN')
+
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO {} ({}, value) VALUES (?, ?)'.format(table, self.KEYS[table]),
+            ((key, self._pack(value)) for key, value in updates.items())
+        )
+        self.connection.executemany(
+            'DELETE FROM {} WHERE {} = ?'.format(table, self.KEYS[table]), ((key,) for key in deletes)
+        )
+
+    def stage(self, load_id, items):
+        if not self.connection.in_transaction:
+            self.connection.execute('BEGIN')
+
+        # New names are counted by the inserted rows, names staged before are updated afterwards
+        changes = self.connection.total_changes
+        self.connection.executemany(
+            'INSERT OR IGNORE INTO staged (load_id, name, value) VALUES (?, ?, ?)',
+            ((load_id, name, self._pack(value)) for name, value in items)
+        )
+        added = self.connection.total_changes - changes
+
+        if added < len(items):
+            self.connection.executemany(
+                'UPDATE staged SET value = ? WHERE load_id = ? AND name = ?',
+                ((self._pack(value), load_id, name) for name, value in items)
+            )
+
+        return added
+
+    def staged(self, load_id):
+        return {
+            name: self._unpack(value)
+            for name, value in self.connection.execute('SELECT name, value FROM staged WHERE load_id = ?', (load_id,))
+        }
+
+    def load_changes(self, load_id, replace):
+        """Pages of PAGE_SIZE names: staged ones first, then the ones to delete"""
+        start = ''
+        while True:
+            page = self.connection.execute(
+                'SELECT name, value FROM staged WHERE load_id = ? AND name >= ? ORDER BY name LIMIT ?',
+                (load_id, start, self.PAGE_SIZE)
+            ).fetchall()
+            if not page:
+                break
+
+            yield {name: self._unpack(value) for name, value in page}, []
+            start = page[-1][0] + '\0'
+
+        start = ''
+        while replace:
+            deletes = [name for name, in self.connection.execute(
+                'SELECT name FROM data WHERE name >= ? AND NOT EXISTS '
+                '(SELECT 1 FROM staged WHERE load_id = ? AND staged.name = data.name) ORDER BY name LIMIT ?',
+                (start, load_id, self.PAGE_SIZE)
+            )]
+            if not deletes:
+                break
+
+            yield {}, deletes
+            start = deletes[-1] + '\0'
+
+    def commit_load(self, load_id, index, replace):
+        """Rows are moved inside the database, values are stored packed in both tables"""
+        if not self.connection.in_transaction:
+            self.connection.execute('BEGIN')
+
+        if replace:
+            self.connection.execute(
+                'DELETE FROM data WHERE NOT EXISTS '
+                '(SELECT 1 FROM staged WHERE load_id = ? AND staged.name = data.name)',
+                (load_id,)
+            )
+
+        self.connection.execute(
+            'INSERT OR REPLACE INTO data (name, value, version) SELECT name, value, ? FROM staged WHERE load_id = ?',
+            (index, load_id)
+        )
+        self.unstage(load_id)
+
+    def unstage(self, load_id):
+        if not self.connection.in_transaction:
+            self.connection.execute('BEGIN')
+
+        self.connection.execute('DELETE FROM staged WHERE load_id = ?', (load_id,))
+
+    def scan(self, start=None, end=None, limit=None):
+        return [
+            (name, self._unpack(value))
+            for name, value in self.connection.execute(*self._range('name, value', start, end, limit))
+        ]
+
+    def names(self):
+        return (name for name, in self.connection.execute('SELECT name FROM data ORDER BY name'))
+
+    def snapshot(self):
+        return SQLiteSnapshot(self)
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def _range(columns, start=None, end=None, limit=None):
+        """SELECT query & parameters for names in [start, end)"""
+        conditions, parameters = [], []
+        if start is not None:
+            conditions.append('name >= ?')
+            parameters.append(start)
+
+        if end is not None:
+            conditions.append('name < ?')
+            parameters.append(end)
+
+        query = 'SELECT {} FROM data'.format(columns)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+
+        query += ' ORDER BY name'
+        if limit is not None:
+            query += ' LIMIT ?'
+            parameters.append(limit)
+
+        return query, parameters
+
+
+class SQLiteSnapshot:
+    """Read transaction of a separate connection: sees the data committed when it was created"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.connection = sqlite3.connect(backend.filename, isolation_level=None)
+        self.connection.execute('BEGIN')
+        self.count = self.connection.execute('SELECT COUNT(*) FROM data').fetchone()[0]
+
+    def __len__(self):
+        return self.count
+
+    def items(self):
+        """(name, value) pairs read page by page, the connection is closed afterwards"""
+        start = None
+        try:
+            while True:
+                page = self.connection.execute(*self.backend._range(
+                    'name, value', start, limit=self.backend.PAGE_SIZE
+                )).fetchall()
+                if not page:
+                    break
+
+                for name, value in page:
+                    yield name, self.backend._unpack(value)
+
+                # The smallest name after the last one
+                start = page[-1][0] + '\0'
+        finally:
+            self.connection.close()
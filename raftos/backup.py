@@ -0,0 +1,85 @@
+import asyncio
+import itertools
+import os
+import struct
+
+from .conf import config
+
+
+class Backup:
+    """State Machine backup file, also the input of bulk loads
+    Records:
+        <length><header> — {'version': VERSION, 'index': <last applied index>, 'count': <amount of names>}
+        <length><chunk> — [[name, value], ...]
+        ...
+
+    Every record is serialized & compressed separately, so files of any size
+    are written and read chunk by chunk
+    """
+
+    VERSION = 1
+    LENGTH = struct.Struct('>I')
+
+    # Amount of names per record
+    CHUNK_SIZE = 1000
+
+    def __init__(self, filename, serializer=None, compressor=None):
+        self.filename = filename
+        self.serializer = serializer or config.serializer
+        self.compressor = compressor or config.compressor
+
+    async def write(self, index, data):
+        """Save snapshot {name: value, ...} taken at index
+        Yields to the event loop after every chunk so the node keeps working meanwhile
+        """
+        temporary = '{}.tmp'.format(self.filename)
+        with open(temporary, 'wb') as f:
+            self._write_record(f, {'version': self.VERSION, 'index': index, 'count': len(data)})
+
+            items = iter(data.items())
+            while True:
+                chunk = [list(item) for item in itertools.islice(items, self.CHUNK_SIZE)]
+                if not chunk:
+                    break
+
+                self._write_record(f, chunk)
+                await asyncio.sleep(0)
+
+        os.replace(temporary, self.filename)
+
+    def read(self):
+        """Header of the backup"""
+        with open(self.filename, 'rb') as f:
+            return self._read_header(f)
+
+    def __iter__(self):
+        """[name, value] pairs"""
+        with open(self.filename, 'rb') as f:
+            self._read_header(f)
+
+            while True:
+                chunk = self._read_record(f)
+                if chunk is None:
+                    break
+
+                yield from chunk
+
+    def _read_header(self, f):
+        header = self._read_record(f)
+        if not isinstance(header, dict) or header.get('version') != self.VERSION:
+            raise ValueError('{} is not a supported backup file'.format(self.filename))
+
+        return header
+
+    def _write_record(self, f, record):
+        packed = self.compressor.pack(self.serializer.pack(record))
+        f.write(self.LENGTH.pack(len(packed)))
+        f.write(packed)
+
+    def _read_record(self, f):
+        length = f.read(self.LENGTH.size)
+        if len(length) < self.LENGTH.size:
+            return None
+
+        packed = f.read(self.LENGTH.unpack(length)[0])
+        return self.serializer.unpack(self.compressor.unpack(packed))
@@ -0,0 +1,85 @@
+from collections import OrderedDict
+
+
+class ReadCache:
+    """Values read from the leader, kept per node {name: (value, version)}
+
+    Version is the index of the log entry that set the value. Cached names are kept up to date
+    by the local State Machine (as its listener): a change applied with a greater index replaces
+    the cached value, so a cached value is never older than the local apply point
+    and never goes back to an older version.
+    Names being read from the leader are reserved: changes applied meanwhile are remembered,
+    so an answer older than them is not cached.
+    Bounded by SIZE names, least recently used are forgotten first
+    """
+
+    SIZE = 10000
+
+    def __init__(self):
+        self.entries = OrderedDict()
+
+        # Names being read {name: [<amount of reads>, (<index>, <value>, <deleted>) of the latest change or None]}
+        self.reserved = {}
+
+    def get(self, name):
+        """(value, version), raise KeyError if name is not cached"""
+        entry = self.entries[name]
+        self.entries.move_to_end(name)
+        return entry
+
+    def reserve(self, name):
+        """Name is going to be read from the leader, call release() once it's done"""
+        self.reserved.setdefault(name, [0, None])[0] += 1
+
+    def release(self, name):
+        reservation = self.reserved[name]
+        reservation[0] -= 1
+        if not reservation[0]:
+            del self.reserved[name]
+
+    def put(self, name, value, version):
+        """Cache the value read from the leader, unless a newer change was applied during the read"""
+        change = self.reserved.get(name, [0, None])[1]
+        if change is not None and change[0] > version:
+            index, value, deleted = change
+            if deleted:
+                return
+
+            version = index
+
+        cached = self.entries.get(name)
+        if cached is not None and cached[1] > version:
+            return
+
+        self.entries[name] = value, version
+        self.entries.move_to_end(name)
+        while len(self.entries) > self.SIZE:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, name=None):
+        """Forget name (everything if name is None), so the next read goes to the leader"""
+        if name is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(name, None)
+
+    def __call__(self, index, updates, deletes):
+        """State Machine listener"""
+        for name, value in updates.items():
+            cached = self.entries.get(name)
+            if cached is not None and cached[1] < index:
+                self.entries[name] = value, index
+
+            if name in self.reserved:
+                self.reserved[name][1] = index, value, False
+
+        for name in deletes:
+            cached = self.entries.get(name)
+            if cached is not None and cached[1] < index:
+                del self.entries[name]
+
+            if name in self.reserved:
+                self.reserved[name][1] = index, None, True
+
+    def __contains__(self, name):
+        return name in self.entries
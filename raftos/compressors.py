@@ -0,0 +1,122 @@
+import importlib
+import importlib.util
+import zlib
+
+
+def _import_optional(name, package):
+    """Optional codecs are imported only when their compressor is created"""
+    if importlib.util.find_spec(package) is None:
+        raise ImportError('{} is not installed!'.format(package))
+
+    return importlib.import_module(name)
+
+
+class BaseCompressor:
+    """Compression stage between serializer and cryptor
+
+    Packed data starts with a single byte codec code (0 — not compressed),
+    so data smaller than <compression_threshold> (e.g. heartbeats) is not compressed at all
+    and data compressed by any known codec can be unpacked
+    """
+
+    CODE = None
+
+    def __init__(self, config):
+        self.config = config
+
+    def pack(self, data):
+        if self.CODE is None or len(data) < self.config.compression_threshold:
+            return bytes([0]) + data
+
+        return bytes([self.CODE]) + self.compress(data)
+
+    def unpack(self, data):
+        code, data = data[0], data[1:]
+        if not code:
+            return data
+
+        if code == self.CODE:
+            return self.decompress(data)
+
+        compressor = compressors.get(code)
+        if compressor is None:
+            raise ValueError('Unknown compression codec {}'.format(code))
+
+        return compressor(self.config).decompress(data)
+
+    def unpack_stored(self, data):
+        """unpack() for files which may be written before compression was introduced:
+        they hold serialized data only, and neither msgpack nor JSON starts with a codec code
+        """
+        if data[0] and data[0] not in compressors:
+            return data
+
+        return self.unpack(data)
+
+    def compress(self, data):
+        raise NotImplementedError
+
+    def decompress(self, data):
+        raise NotImplementedError
+
+
+class DummyCompressor(BaseCompressor):
+    pass
+
+
+class ZlibCompressor(BaseCompressor):
+    CODE = 1
+
+    # 1 (fastest) — 9 (smallest)
+    LEVEL = 1
+
+    def compress(self, data):
+        return zlib.compress(data, self.LEVEL)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class LZ4Compressor(BaseCompressor):
+    """Requires lz4 package"""
+
+    CODE = 2
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lz4 = _import_optional('lz4.frame', 'lz4')
+
+    def compress(self, data):
+        return self.lz4.compress(data)
+
+    def decompress(self, data):
+        return self.lz4.decompress(data)
+
+
+class ZstdCompressor(BaseCompressor):
+    """Requires zstandard package"""
+
+    CODE = 3
+
+    LEVEL = 3
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        zstandard = _import_optional('zstandard', 'zstandard')
+
+        self.compressor = zstandard.ZstdCompressor(level=self.LEVEL)
+        self.decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def decompress(self, data):
+        return self.decompressor.decompress(data)
+
+
+compressors = {
+    compressor.CODE: compressor
+    for compressor in (ZlibCompressor, LZ4Compressor, ZstdCompressor)
+}
+
+default_compressor = ZlibCompressor
@@ -1,3 +1,7 @@
+import time
+
+from .backends import MemoryBackend
+from .compressors import default_compressor
 from .cryptors import default_cryptor
 from .serializers import MessagePackSerializer
 
@@ -12,6 +16,14 @@ class Configuration:
             'log_path': '/var/log/raftos/',
             'serializer': MessagePackSerializer,
 
+            # State Machine storage: MemoryBackend (one file) or SQLiteBackend (ordered on disk)
+            'state_machine_backend': MemoryBackend,
+
+            # Ids (host:port) of witness members: they vote, and count in commit quorums only while
+            # less than a majority of full replicas respond, but keep only terms of log entries —
+            # no commands, no State Machine — and never lead
+            'witnesses': (),
+
             'heartbeat_interval': 0.3,
 
             # Leader will step down if it doesn't have a majority of follower's responses
@@ -22,11 +34,56 @@ class Configuration:
             # [step_down_missed_heartbeats, M * step_down_missed_heartbeats]
             'election_interval_spread': 3,
 
+            # Opt-in: heartbeats (and election timeouts) of a cluster which got no commands for <idle_timeout>
+            # seconds are this interval, failover of an idle cluster takes longer then
+            'idle_heartbeat_interval': None,
+            'idle_timeout': 10,
+
+            # Opt-in: the leader derives heartbeat_interval from RTT percentile to its followers
+            # (within bounds, seconds) and advertises it, election timeouts of every node follow it
+            'auto_tune_timeouts': False,
+            'auto_tune_percentile': 99,
+            'auto_tune_heartbeat_bounds': (0.05, 1),
+            'auto_tune_min_samples': 20,
+
+            # Max time to wait for a leader to be elected before raising NotALeaderException
+            'election_wait_timeout': 5,
+
+            # Followers forward proposals & reads to the leader and wait for the result
+            'forward_requests': True,
+            'forward_timeout': 5,
+
+            # Proposals are retried on timeouts & leader changes, client sessions make retries safe
+            'proposal_retries': 3,
+
+            # Max amount of outbound messages waiting per priority lane (control / data)
+            'outbound_queue_size': 1000,
+
+            # Larger messages (bytes) are split into fragments, the receiver requests missing ones again
+            # every <fragment_nack_interval> seconds and gives up after <reassembly_timeout>
+            'max_datagram_size': 1400,
+            'fragment_nack_interval': 0.1,
+            'reassembly_timeout': 5,
+
+            # Memory limits (bytes) for incomplete received messages & sent fragments kept for retransmission
+            'reassembly_buffer_size': 64 * 1024 * 1024,
+            'sent_fragments_size': 64 * 1024 * 1024,
+
             # For UDP messages encryption
             'secret_key': b'raftos sample secret key',
             'salt': b'raftos sample salt',
             'cryptor': default_cryptor,
 
+            # Messages, log entries & State Machine files are compressed after serialization,
+            # data smaller than threshold (bytes) is left as is
+            'compressor': default_compressor,
+            'compression_threshold': 512,
+
+            # Replicated clock: the leader stamps it into commands with TTLs
+            # and checks for expired names every <expiry_interval> seconds
+            'clock': time.time,
+            'expiry_interval': 1,
+
             # Election callbacks
             'on_leader': lambda: None,
             'on_follower': lambda: None
@@ -36,15 +93,12 @@ class Configuration:
         for param, value in kwargs.items():
             setattr(self, param.lower(), value)
 
-        self.step_down_interval = self.heartbeat_interval * self.step_down_missed_heartbeats
-        self.election_interval = (
-            self.step_down_interval,
-            self.step_down_interval * self.election_interval_spread
-        )
-
         if isinstance(self.cryptor, type):
             self.cryptor = self.cryptor(self)
 
+        if isinstance(self.compressor, type):
+            self.compressor = self.compressor(self)
+
 
 config = Configuration()
 configure = config.configure
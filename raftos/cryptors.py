@@ -1,18 +1,13 @@
 import base64
+import importlib.util
 
 from .log import logger
 
-try:
-    from cryptography.fernet import Fernet
-    from cryptography.hazmat.backends import default_backend
-    from cryptography.hazmat.primitives import hashes
-    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
-    crypto_enabled = True
-
-except ImportError:
-    crypto_enabled = False
+# cryptography is imported on the first encrypt / decrypt
+crypto_enabled = importlib.util.find_spec('cryptography') is not None
 
+if not crypto_enabled:
     logger.warning('cryptography is not installed!')
 
 
@@ -28,23 +23,46 @@ class BaseCryptor:
 
 
 class Cryptor(BaseCryptor):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+    """Fernet with a key derived from <secret_key> & <salt>
+
+    Derivation is slow on purpose (PBKDF2), so it's done on the first encrypt / decrypt
+    and its result is cached per (secret_key, salt): configure() may change them any time
+    """
+
+    ITERATIONS = 100000
+
+    # {(secret_key, salt): Fernet}
+    keys = {}
+
+    @property
+    def fernet(self):
+        key = self.config.secret_key, self.config.salt
+        if key not in self.keys:
+            self.keys[key] = self.derive(*key)
+
+        return self.keys[key]
+
+    @classmethod
+    def derive(cls, secret_key, salt):
+        from cryptography.fernet import Fernet
+        from cryptography.hazmat.backends import default_backend
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
         kdf = PBKDF2HMAC(
             algorithm=hashes.SHA256(),
             length=32,
-            salt=self.config.salt,
-            iterations=100000,
+            salt=salt,
+            iterations=cls.ITERATIONS,
             backend=default_backend()
         )
-        self.f = Fernet(base64.urlsafe_b64encode(kdf.derive(self.config.secret_key)))
+        return Fernet(base64.urlsafe_b64encode(kdf.derive(secret_key)))
 
     def encrypt(self, data):
-        return self.f.encrypt(data)
+        return self.fernet.encrypt(data)
 
     def decrypt(self, data):
-        return self.f.decrypt(data)
+        return self.fernet.decrypt(data)
 
 
 class DummyCryptor(BaseCryptor):
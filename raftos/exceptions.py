@@ -1,3 +1,15 @@
 
 class NotALeaderException(Exception):
     pass
+
+
+class PreconditionFailedException(Exception):
+    pass
+
+
+class CompactedIndexException(Exception):
+    pass
+
+
+class SessionExpiredException(Exception):
+    pass
@@ -0,0 +1,66 @@
+"""Compact wire format of Raft messages
+
+Messages are dicts inside raftos, on the wire they are positional lists:
+    [<version>, <type code>, <field 1>, <field 2>, ...]
+
+Fields order is fixed per type. New optional fields may only be appended to the end:
+missing trailing fields are decoded as None, unknown trailing fields are ignored,
+anything else requires a new VERSION
+"""
+
+VERSION = 1
+
+# {<type code>: (<type>, (<field>, ...))}
+SCHEMA = {
+    1: ('request_vote', ('term', 'candidate_id', 'last_log_index', 'last_log_term')),
+    2: ('request_vote_response', ('term', 'vote_granted', 'success', 'request_id')),
+    3: ('append_entries', (
+        'term', 'leader_id', 'commit_index', 'request_id', 'prev_log_index', 'prev_log_term', 'entries',
+        'heartbeat_interval'
+    )),
+    4: ('append_entries_response', ('term', 'success', 'last_log_index', 'request_id')),
+    5: ('forward_request', ('request_id', 'method', 'args', 'kwargs')),
+    6: ('forward_request_response', ('request_id', 'result', 'error', 'message', 'args'))
+}
+
+MESSAGE_TYPES = [message_type for message_type, _ in SCHEMA.values()]
+
+_codes = {message_type: (code, fields) for code, (message_type, fields) in SCHEMA.items()}
+
+
+def encode(data):
+    """dict -> positional list"""
+    code, fields = _codes[data['type']]
+
+    message = [VERSION, code]
+    message.extend(data.get(field) for field in fields)
+
+    if data.get('entries'):
+        position = 2 + fields.index('entries')
+        message[position] = [[entry['term'], entry['command']] for entry in data['entries']]
+
+    return message
+
+
+def decode(message, sender):
+    """positional list -> dict with the sender address"""
+    version, code = message[0], message[1]
+    if version != VERSION:
+        raise ValueError('Unsupported message version {}'.format(version))
+
+    message_type, fields = SCHEMA[code]
+    values = message[2:]
+
+    data = dict(zip(fields, values))
+    for field in fields[len(values):]:
+        data[field] = None
+
+    data['type'] = message_type
+    data['sender'] = sender
+
+    if 'entries' in data:
+        data['entries'] = [
+            {'term': term, 'command': command} for term, command in data['entries'] or ()
+        ]
+
+    return data
@@ -1,36 +1,300 @@
 import asyncio
+import random
+import struct
+from collections import OrderedDict, deque
 
+from . import messages
 from .log import logger
 from .conf import config
 
 
+class OutboundQueue:
+    """Outbound messages queue with priority lanes
+
+    Control traffic (heartbeats, votes, responses) always goes out before data replication,
+    so a backlog of AppendEntries can't delay heartbeats and make the leader step down.
+    Both lanes are bounded by <outbound_queue_size>:
+        data lane — put() waits until there is free space
+        control lane — the oldest message with the same key (e.g. type & destination) is dropped:
+            the new one supersedes it. If there is no such message the new one is dropped
+    """
+
+    CONTROL = 0
+    DATA = 1
+
+    def __init__(self, loop, maxsize=None):
+        self.loop = loop
+        self.maxsize = maxsize or config.outbound_queue_size
+
+        self.lanes = (deque(), deque())
+        self.getter = None
+        self.putters = deque()
+
+        self.dropped = 0
+
+    async def put(self, item, priority=CONTROL, key=None):
+        lane = self.lanes[priority]
+
+        if priority == self.CONTROL:
+            if len(lane) >= self.maxsize:
+                self.dropped += 1
+
+                superseded = next((queued for queued in lane if queued[0] == key), None) if key else None
+                if superseded is None:
+                    return
+
+                lane.remove(superseded)
+
+        else:
+            while len(lane) >= self.maxsize:
+                putter = asyncio.Future(loop=self.loop)
+                self.putters.append(putter)
+                await putter
+
+        lane.append((key, item))
+        if self.getter is not None and not self.getter.done():
+            self.getter.set_result(None)
+
+    async def get(self):
+        while not self.qsize():
+            self.getter = asyncio.Future(loop=self.loop)
+            await self.getter
+
+        for lane in self.lanes:
+            if lane:
+                _, item = lane.popleft()
+                break
+
+        if lane is self.lanes[self.DATA]:
+            while self.putters:
+                putter = self.putters.popleft()
+                if not putter.done():
+                    putter.set_result(None)
+                    break
+
+        return item
+
+    def qsize(self):
+        return sum(len(lane) for lane in self.lanes)
+
+    @property
+    def depth(self):
+        return {
+            'control': len(self.lanes[self.CONTROL]),
+            'data': len(self.lanes[self.DATA]),
+            'dropped': self.dropped
+        }
+
+
+class ReassemblyBuffer:
+    """Fragments of incomplete messages {(sender, message_id): message}
+
+    Bounded by <reassembly_buffer_size> bytes — the oldest incomplete messages are dropped first.
+    Ids of recently completed messages are remembered, so late duplicate fragments are ignored
+    """
+
+    # Amount of completed message ids remembered
+    COMPLETED_SIZE = 1000
+
+    def __init__(self, loop, maxsize=None, timeout=None):
+        self.loop = loop
+        self.maxsize = maxsize or config.reassembly_buffer_size
+        self.timeout = timeout or config.reassembly_timeout
+
+        self.messages = OrderedDict()
+        self.completed = OrderedDict()
+        self.size = 0
+
+    def add(self, key, number, count, chunk):
+        """Returns the whole payload if this fragment completes the message"""
+        if key in self.completed or number >= count:
+            return None
+
+        message = self.messages.get(key)
+        if message is None:
+            message = self.messages[key] = {'count': count, 'fragments': {}, 'started': self.loop.time()}
+
+        if number in message['fragments']:
+            return None
+
+        message['fragments'][number] = chunk
+        self.size += len(chunk)
+
+        if len(message['fragments']) == message['count']:
+            self.discard(key)
+            self.completed[key] = None
+            while len(self.completed) > self.COMPLETED_SIZE:
+                self.completed.popitem(last=False)
+
+            return b''.join(message['fragments'][number] for number in range(message['count']))
+
+        while self.size > self.maxsize:
+            self.discard(next(iter(self.messages)))
+
+        return None
+
+    def missing(self, key):
+        message = self.messages[key]
+        return [number for number in range(message['count']) if number not in message['fragments']]
+
+    def is_expired(self, key):
+        return self.loop.time() - self.messages[key]['started'] > self.timeout
+
+    def discard(self, key):
+        message = self.messages.pop(key, None)
+        if message is not None:
+            self.size -= sum(len(chunk) for chunk in message['fragments'].values())
+
+    def __contains__(self, key):
+        return key in self.messages
+
+
+class SentFragments:
+    """Fragments of sent messages kept for retransmission {message_id: (destination, [fragment, ...])}
+    Bounded by <sent_fragments_size> bytes — the oldest messages are forgotten first
+    """
+
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize or config.sent_fragments_size
+
+        self.messages = OrderedDict()
+        self.size = 0
+
+    def add(self, message_id, destination, fragments):
+        self.messages[message_id] = destination, fragments
+        self.size += sum(len(fragment) for fragment in fragments)
+
+        while self.size > self.maxsize and len(self.messages) > 1:
+            _, (_, forgotten) = self.messages.popitem(last=False)
+            self.size -= sum(len(fragment) for fragment in forgotten)
+
+    def get(self, message_id, destination, numbers):
+        """Requested fragments if the message was sent to destination and is still kept"""
+        sent_to, fragments = self.messages.get(message_id, (None, []))
+        if sent_to != destination:
+            return []
+
+        return [fragments[number] for number in numbers if number < len(fragments)]
+
+
 class UDPProtocol(asyncio.DatagramProtocol):
-    def __init__(self, queue, request_handler, loop, serializer=None, cryptor=None):
+    """Every datagram starts with a kind byte:
+        WHOLE — <kind><message>
+        FRAGMENT — <kind><message id><fragment number><fragments count><chunk>
+        NACK — <kind><message id><missing fragment number>...
+
+    Messages larger than <max_datagram_size> are split into fragments. The receiver reassembles them
+    and requests missing fragments (NACK) every <fragment_nack_interval> seconds
+    until the message is complete or <reassembly_timeout> expires
+    """
+
+    WHOLE = 0
+    FRAGMENT = 1
+    NACK = 2
+
+    FRAGMENT_HEADER = struct.Struct('>BQHH')
+    NACK_HEADER = struct.Struct('>BQ')
+    NACK_NUMBER = struct.Struct('>H')
+
+    def __init__(self, queue, request_handler, loop, serializer=None, cryptor=None, compressor=None):
         self.queue = queue
         self.serializer = serializer or config.serializer
         self.cryptor = cryptor or config.cryptor
+        self.compressor = compressor or config.compressor
         self.request_handler = request_handler
         self.loop = loop
 
+        # Random start, so ids of a restarted node don't collide with fragments other nodes still keep
+        self.message_id = random.getrandbits(62)
+        self.reassembly = ReassemblyBuffer(loop)
+        self.sent = SentFragments()
+
     def __call__(self):
         return self
 
     async def start(self):
         while not self.transport.is_closing():
             request = await self.queue.get()
-            data = self.cryptor.encrypt(self.serializer.pack(request['data']))
-            self.transport.sendto(data, request['destination'])
+            message = messages.encode(request['data'])
+            data = self.cryptor.encrypt(self.compressor.pack(self.serializer.pack(message)))
+            self.sendto(data, request['destination'])
+
+    def sendto(self, data, destination):
+        if len(data) < config.max_datagram_size:
+            self.transport.sendto(bytes([self.WHOLE]) + data, destination)
+            return
+
+        chunk_size = config.max_datagram_size - self.FRAGMENT_HEADER.size
+        count = -(-len(data) // chunk_size)
+        if count > 0xFFFF:
+            logger.error('Message of {} bytes is too large to send'.format(len(data)))
+            return
+
+        self.message_id += 1
+        fragments = [
+            self.FRAGMENT_HEADER.pack(self.FRAGMENT, self.message_id, number, count) +
+            data[number * chunk_size:(number + 1) * chunk_size]
+            for number in range(count)
+        ]
+        self.sent.add(self.message_id, destination, fragments)
+
+        for fragment in fragments:
+            self.transport.sendto(fragment, destination)
 
     def connection_made(self, transport):
         self.transport = transport
         asyncio.ensure_future(self.start(), loop=self.loop)
 
     def datagram_received(self, data, sender):
-        data = self.serializer.unpack(self.cryptor.decrypt(data))
-        data.update({
-            'sender': sender
-        })
-        self.request_handler(data)
+        kind = data[0]
+        if kind == self.WHOLE:
+            self.message_received(data[1:], sender)
+
+        elif kind == self.FRAGMENT:
+            self.fragment_received(data, sender)
+
+        elif kind == self.NACK:
+            self.nack_received(data, sender)
+
+    def message_received(self, data, sender):
+        message = self.serializer.unpack(self.compressor.unpack(self.cryptor.decrypt(data)))
+        self.request_handler(messages.decode(message, sender))
+
+    def fragment_received(self, data, sender):
+        _, message_id, number, count = self.FRAGMENT_HEADER.unpack_from(data)
+        key = sender, message_id
+
+        is_new = key not in self.reassembly
+        payload = self.reassembly.add(key, number, count, data[self.FRAGMENT_HEADER.size:])
+
+        if payload is not None:
+            self.message_received(payload, sender)
+
+        elif is_new and key in self.reassembly:
+            self.loop.call_later(config.fragment_nack_interval, self.request_missing, key)
+
+    def request_missing(self, key):
+        if key not in self.reassembly or self.transport.is_closing():
+            return
+
+        if self.reassembly.is_expired(key):
+            self.reassembly.discard(key)
+            return
+
+        sender, message_id = key
+        limit = (config.max_datagram_size - self.NACK_HEADER.size) // self.NACK_NUMBER.size
+        self.transport.sendto(self.NACK_HEADER.pack(self.NACK, message_id) + b''.join(
+            self.NACK_NUMBER.pack(number) for number in self.reassembly.missing(key)[:limit]
+        ), sender)
+
+        self.loop.call_later(config.fragment_nack_interval, self.request_missing, key)
+
+    def nack_received(self, data, sender):
+        _, message_id = self.NACK_HEADER.unpack_from(data)
+        numbers = [number for number, in self.NACK_NUMBER.iter_unpack(data[self.NACK_HEADER.size:])]
+
+        for fragment in self.sent.get(message_id, sender, numbers):
+            self.transport.sendto(fragment, sender)
 
     def error_received(self, exc):
         logger.error('Error received {}'.format(exc))
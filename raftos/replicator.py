@@ -1,6 +1,10 @@
 import asyncio
+import copy
 import functools
+import random
+import uuid
 
+from .exceptions import PreconditionFailedException
 from .state import State
 
 
@@ -23,32 +27,89 @@ class Replicated:
 
     DEFAULT_VALUE = None
 
+    # modify() gives up after this many conflicts, waiting up to BACKOFF seconds
+    # (doubled after every conflict) before the next attempt
+    MODIFY_ATTEMPTS = 10
+    MODIFY_BACKOFF = 0.01
+
     def __init__(self, name, default='REPLICATED_DEFAULT'):
         self.lock = asyncio.Lock()
         self.name = name
 
         # For subclasses like ReplicatedDict
         if default == 'REPLICATED_DEFAULT':
-            self.value = self.DEFAULT_VALUE
+            self.default = self.DEFAULT_VALUE
         else:
-            self.value = default
+            self.default = default
 
-        self.in_memory = False
+        self.value = copy.deepcopy(self.default)
 
     async def get(self):
-        # If we didn't set a value in this life cycle try to get it from State Machine
-        if not self.in_memory:
-            try:
-                self.value = await State.get_value(self.name)
-            except KeyError:
-                pass
+        """Served from the read cache of this node if possible, see State.get_cached_value"""
+        try:
+            self.value, _ = await State.get_cached_value(self.name)
+        except KeyError:
+            self.value = copy.deepcopy(self.default)
 
         return self.value
 
-    async def set(self, value):
-        await State.set_value(self.name, value)
+    async def set(self, value, ttl=None):
+        """Args:
+            ttl — seconds until the value is deleted
+        """
+        await State.set_value(self.name, value, ttl=ttl)
         self.value = value
-        self.in_memory = True
+
+    def watch(self, start_index=None):
+        """Async iterator of changes applied on this node
+            async for change in replicated.watch():
+                change['index'], change['value']
+        """
+        return State.watch(name=self.name, start_index=start_index)
+
+    async def get_version(self):
+        """Index of the log entry that changed the value last (0 if it was never set)"""
+        return await State.get_version(self.name)
+
+    async def get_with_version(self):
+        """Private copy of the current value and its version"""
+        try:
+            value, version = await State.get_versioned_value(self.name)
+        except KeyError:
+            value, version = self.default, 0
+
+        return copy.deepcopy(value), version
+
+    async def compare_and_set(self, expected_version, value):
+        """Set value only if it's still at expected_version (0 — never set)
+        The check happens when the State Machine applies the change, return True on success
+        """
+        if await State.compare_and_set(self.name, expected_version, value):
+            self.value = value
+            return True
+
+        return False
+
+    async def modify(self, function):
+        """Optimistic read-modify-write: function(value) changes a private copy of the value in place,
+        retried if the value was changed by anyone else in between. Return the function result,
+        raise PreconditionFailedException if the value keeps changing for MODIFY_ATTEMPTS attempts
+        """
+        backoff = self.MODIFY_BACKOFF
+        for attempt in range(self.MODIFY_ATTEMPTS):
+            if attempt:
+                # Randomized so writers conflicting with each other don't retry in lockstep
+                await asyncio.sleep(random.uniform(0, backoff))
+                backoff *= 2
+
+            value, version = await self.get_with_version()
+            result = function(value)
+            if await self.compare_and_set(version, value):
+                return result
+
+        raise PreconditionFailedException(
+            '{} was changed concurrently {} times in a row!'.format(self.name, self.MODIFY_ATTEMPTS)
+        )
 
 
 class ReplicatedContainer(Replicated):
@@ -67,9 +128,7 @@ class ReplicatedDict(ReplicatedContainer):
 
     @atomic_method
     async def update(self, kwargs):
-        data = await self.get()
-        data.update(kwargs)
-        await self.set(data)
+        await self.modify(lambda data: data.update(kwargs))
 
     async def keys(self):
         data = await self.get()
@@ -85,16 +144,11 @@ class ReplicatedDict(ReplicatedContainer):
 
     @atomic_method
     async def pop(self, key, default):
-        data = await self.get()
-        item = data.pop(key, default)
-        await self.set(data)
-        return item
+        return await self.modify(lambda data: data.pop(key, default))
 
     @atomic_method
     async def delete(self, key):
-        data = await self.get()
-        del data[key]
-        await self.set(data)
+        await self.modify(lambda data: data.__delitem__(key))
 
 
 class ReplicatedList(ReplicatedContainer):
@@ -104,12 +158,193 @@ class ReplicatedList(ReplicatedContainer):
 
     @atomic_method
     async def append(self, kwargs):
-        data = await self.get()
-        data.append(kwargs)
-        await self.set(data)
+        await self.modify(lambda data: data.append(kwargs))
 
     @atomic_method
     async def extend(self, lst):
-        data = await self.get()
-        data.extend(lst)
-        await self.set(data)
+        await self.modify(lambda data: data.extend(lst))
+
+
+class ReplicatedCounter(Replicated):
+    """Counter changed by the State Machine: only deltas are replicated, no local lock is needed"""
+
+    DEFAULT_VALUE = 0
+
+    async def increment(self, delta=1):
+        self.value = await State.execute('increment', name=self.name, delta=delta)
+        return self.value
+
+    async def decrement(self, delta=1):
+        return await self.increment(-delta)
+
+
+class ReplicatedSet(Replicated):
+    """Set changed by the State Machine: only added/removed items are replicated"""
+
+    DEFAULT_VALUE = []
+
+    async def add(self, item):
+        """Return False if item was already in the set"""
+        return await State.execute('set_add', name=self.name, item=item)
+
+    async def remove(self, item):
+        if not await self.discard(item):
+            raise KeyError(item)
+
+    async def discard(self, item):
+        """Return False if item was not in the set"""
+        return await State.execute('set_remove', name=self.name, item=item)
+
+    async def contains(self, item):
+        return await State.contains(self.name, item)
+
+    async def length(self):
+        return len(await self.get())
+
+
+class ReplicatedQueue(Replicated):
+    """FIFO queue changed by the State Machine: only pushed items and pops are replicated"""
+
+    DEFAULT_VALUE = []
+
+    async def push(self, *items):
+        """Append items to the tail, return the new length"""
+        return await State.execute('queue_push', name=self.name, items=list(items))
+
+    async def pop(self, block=True, timeout=None):
+        """Remove & return the head item
+        Args:
+            block — wait for an item if the queue is empty, raise IndexError otherwise
+            timeout — max time to wait, raise asyncio.TimeoutError afterwards
+        """
+        deadline = State.loop.time() + timeout if timeout is not None else None
+
+        # Subscribe before popping so a push applied in between is not missed
+        watch = State.watch(name=self.name) if block else None
+        try:
+            while True:
+                result = await State.execute('queue_pop', name=self.name)
+                if not result['empty']:
+                    return result['item']
+
+                if not block:
+                    raise IndexError('pop from an empty queue')
+
+                remaining = max(deadline - State.loop.time(), 0) if deadline is not None else None
+                await asyncio.wait_for(watch.__anext__(), remaining)
+        finally:
+            if watch is not None:
+                watch.close()
+
+    async def length(self):
+        return len(await self.get())
+
+
+class ReplicatedLock:
+    """Distributed lock held with a lease: it's passed on if the holder doesn't release it within ttl
+
+        lock = raftos.ReplicatedLock(name='migrations', ttl=30)
+        async with lock:
+            await storage.write(data, fencing_token=lock.token)
+
+    Waiters get the lock in FIFO order and are woken up when their node applies the change, no polling.
+    Every acquire / release is a single log entry.
+    Token (fencing token) is the log index that granted the lock, it's greater for every new holder,
+    so resources can reject writes from a holder whose lease has already run out
+    """
+
+    def __init__(self, name, ttl=10):
+        self.name = name
+        self.ttl = ttl
+
+        # Unique per lock object: two objects with the same name in one process exclude each other too
+        self.owner = uuid.uuid4().hex
+        self.token = None
+
+    async def acquire(self, timeout=None):
+        """Wait for the lock (or extend the lease if it's held already), return the fencing token"""
+        self.token = await State.acquire_lock(self.name, self.owner, self.ttl, timeout=timeout)
+        return self.token
+
+    async def release(self):
+        """Return False if the lock was not held (e.g. the lease has run out)"""
+        self.token = None
+        return await State.release_lock(self.name, self.owner)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.release()
+
+
+class Transaction:
+    """Changes of many Replicated objects applied atomically with a single log entry
+
+        async with raftos.Transaction() as transaction:
+            transaction.expect(data_id, version=17)
+            transaction.set(data_id, 42)
+            transaction.set(data, {'id': 42})
+
+    Changes are proposed when the block exits without an exception.
+    If any expectation doesn't hold at apply time nothing is changed and
+    PreconditionFailedException is raised
+    """
+
+    def __init__(self):
+        self.updates = {}
+        self.deletes = []
+        self.conditions = {}
+
+        self.objects = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            await self.commit()
+
+    def set(self, replicated, value):
+        name = self._register(replicated)
+        self.updates[name] = value
+        if name in self.deletes:
+            self.deletes.remove(name)
+
+    def delete(self, replicated):
+        name = self._register(replicated)
+        self.updates.pop(name, None)
+        self.deletes.append(name)
+
+    def expect(self, replicated, **condition):
+        """Require value or version of replicated to be as expected
+        Args:
+            value — current value
+            version — current version (0 — value is not set)
+        """
+        if set(condition) - {'value', 'version'} or not condition:
+            raise ValueError('Expected value and/or version, got {}'.format(condition))
+
+        self.conditions[self._register(replicated)] = condition
+
+    async def commit(self):
+        if not self.updates and not self.deletes:
+            return
+
+        await State.apply_transaction(self.updates, self.deletes, self.conditions)
+
+        for name, replicated in self.objects.items():
+            if name in self.updates:
+                replicated.value = self.updates[name]
+
+            elif name in self.deletes:
+                replicated.value = copy.deepcopy(replicated.default)
+
+    def _register(self, replicated):
+        """Accept Replicated objects as well as plain names"""
+        if isinstance(replicated, Replicated):
+            self.objects[replicated.name] = replicated
+            return replicated.name
+
+        return replicated
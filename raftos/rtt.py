@@ -0,0 +1,80 @@
+from collections import OrderedDict, deque
+
+
+class RTTMonitor:
+    """Round trip times of AppendEntries per follower, measured by the leader
+
+    Sending time of the first request of every heartbeat round (request_id) is kept
+    and the response with the same request_id closes the sample.
+    The most recent SAMPLES per follower are kept
+    """
+
+    SAMPLES = 100
+
+    # Amount of rounds per follower waiting for responses
+    PENDING = 100
+
+    # Tuned heartbeat interval — this many RTTs (of the percentile) at least
+    HEARTBEAT_RTT_FACTOR = 4
+
+    def __init__(self, loop):
+        self.loop = loop
+
+        # {<follower>: deque([rtt, ...])}
+        self.samples = {}
+
+        # {<follower>: OrderedDict({<request_id>: <sending time>})}
+        self.pending = {}
+
+    def sent(self, follower, request_id):
+        pending = self.pending.setdefault(follower, OrderedDict())
+        if request_id in pending:
+            return
+
+        pending[request_id] = self.loop.time()
+        while len(pending) > self.PENDING:
+            pending.popitem(last=False)
+
+    def received(self, follower, request_id):
+        sent_at = self.pending.get(follower, {}).pop(request_id, None)
+        if sent_at is None:
+            return
+
+        samples = self.samples.setdefault(follower, deque(maxlen=self.SAMPLES))
+        samples.append(self.loop.time() - sent_at)
+
+    def in_flight(self, follower, timeout):
+        """Amount of rounds sent to follower within timeout seconds and not answered yet"""
+        sent_after = self.loop.time() - timeout
+        return len([sent_at for sent_at in self.pending.get(follower, {}).values() if sent_at > sent_after])
+
+    def percentile(self, percent, follower=None):
+        """RTT percentile of one follower (or all of them), None if nothing is measured yet"""
+        if follower is not None:
+            samples = sorted(self.samples.get(follower, ()))
+        else:
+            samples = sorted(rtt for follower_samples in self.samples.values() for rtt in follower_samples)
+
+        if not samples:
+            return None
+
+        return samples[min(int(len(samples) * percent / 100), len(samples) - 1)]
+
+    def stats(self):
+        return {
+            follower: {
+                'samples': len(samples),
+                'last': samples[-1],
+                'p50': self.percentile(50, follower),
+                'p99': self.percentile(99, follower)
+            }
+            for follower, samples in self.samples.items() if samples
+        }
+
+    def heartbeat_interval(self, percent, bounds, min_samples):
+        """Heartbeat interval derived from RTT percentile within bounds (None if there are too few samples)"""
+        if sum(len(samples) for samples in self.samples.values()) < min_samples:
+            return None
+
+        low, high = bounds
+        return min(max(self.percentile(percent) * self.HEARTBEAT_RTT_FACTOR, low), high)
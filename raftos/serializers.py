@@ -1,27 +1,32 @@
-import msgpack
+import functools
+import importlib
+import importlib.util
 
-try:
-    import ujson as json
-except ImportError:
-    import json
+
+@functools.lru_cache()
+def _import(*names):
+    """The first of the modules installed, imported on the first use"""
+    for name in names:
+        if importlib.util.find_spec(name) is not None:
+            return importlib.import_module(name)
 
 
 class JSONSerializer:
     @staticmethod
     def pack(data):
-        return json.dumps(data).encode()
+        return _import('ujson', 'json').dumps(data).encode()
 
     @staticmethod
     def unpack(data):
         decoded = data.decode() if isinstance(data, bytes) else data
-        return json.loads(decoded)
+        return _import('ujson', 'json').loads(decoded)
 
 
 class MessagePackSerializer:
     @staticmethod
     def pack(data):
-        return msgpack.packb(data, use_bin_type=True)
+        return _import('msgpack').packb(data, use_bin_type=True)
 
     @staticmethod
     def unpack(data):
-        return msgpack.unpackb(data, use_list=True, encoding='utf-8')
+        return _import('msgpack').unpackb(data, use_list=True, encoding='utf-8')
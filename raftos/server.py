@@ -1,21 +1,23 @@
 import asyncio
 import functools
 
-from .network import UDPProtocol
+from .network import OutboundQueue, UDPProtocol
 from .state import State
 
 
-async def register(*address_list, cluster=None, loop=None):
+async def register(*address_list, cluster=None, loop=None, network=None):
     """Start Raft node (server)
     Args:
         address_list — 127.0.0.1:8000 [, 127.0.0.1:8001 ...]
         cluster — [127.0.0.1:8001, 127.0.0.1:8002, ...]
+        network — object with create_datagram_endpoint() used instead of real UDP sockets,
+            e.g. raftos.simulation.SimulatedNetwork
     """
 
     loop = loop or asyncio.get_event_loop()
     for address in address_list:
         host, port = address.rsplit(':', 1)
-        node = Node(address=(host, int(port)), loop=loop)
+        node = Node(address=(host, int(port)), loop=loop, network=network)
         await node.start()
 
         for address in cluster:
@@ -36,13 +38,14 @@ class Node:
 
     nodes = []
 
-    def __init__(self, address, loop):
+    def __init__(self, address, loop, network=None):
         self.host, self.port = address
         self.cluster = set()
 
         self.loop = loop
+        self.network = network or loop
         self.state = State(self)
-        self.requests = asyncio.Queue(loop=self.loop)
+        self.requests = OutboundQueue(loop=self.loop)
         self.__class__.nodes.append(self)
 
     async def start(self):
@@ -53,7 +56,7 @@ class Node:
         )
         address = self.host, self.port
         self.transport, _ = await asyncio.Task(
-            self.loop.create_datagram_endpoint(protocol, local_addr=address),
+            self.network.create_datagram_endpoint(protocol, local_addr=address),
             loop=self.loop
         )
         self.state.start()
@@ -85,7 +88,22 @@ class Node:
         await self.requests.put({
             'data': data,
             'destination': destination
-        })
+        }, priority=self.get_priority(data), key=(data['type'], destination))
+
+    @staticmethod
+    def get_priority(data):
+        """AppendEntries with entries & forwarded client calls (and their results) are data,
+        everything else is control
+        """
+        if data['type'] in ('forward_request', 'forward_request_response') or data.get('entries'):
+            return OutboundQueue.DATA
+
+        return OutboundQueue.CONTROL
+
+    @property
+    def queue_depth(self):
+        """Amount of outbound messages waiting per lane"""
+        return self.requests.depth
 
     def broadcast(self, data):
         """Sends data to all Nodes in cluster (cluster list does not contain self Node)"""
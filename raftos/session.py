@@ -0,0 +1,42 @@
+import os
+import uuid
+
+
+class ClientSession:
+    """Numbers requests of this process so the State Machine can detect retried duplicates
+
+    acknowledged — every request up to this sequence has got its result,
+    State Machine may forget results up to it
+    """
+
+    def __init__(self, client_id=None):
+        self.client_id = client_id or uuid.uuid4().hex
+
+        # Forked processes start their own sessions, see State.get_session
+        self.pid = os.getpid()
+        self.sequence = 0
+        self.in_flight = set()
+
+    def start_request(self):
+        self.sequence += 1
+        self.in_flight.add(self.sequence)
+        return self.sequence
+
+    def finish_request(self, sequence):
+        self.in_flight.discard(sequence)
+
+    @property
+    def acknowledged(self):
+        if self.in_flight:
+            return min(self.in_flight) - 1
+
+        return self.sequence
+
+    def wrap(self, sequence, command):
+        """State Machine command applied once per sequence"""
+        return ['session', {
+            'client_id': self.client_id,
+            'sequence': sequence,
+            'acknowledged': self.acknowledged,
+            'command': command
+        }]
@@ -0,0 +1,171 @@
+import asyncio
+import random
+
+
+class _VirtualSelector:
+    """Selector that never waits: instead of blocking it moves the loop clock forward"""
+
+    def __init__(self, loop):
+        self.loop = loop
+
+    def select(self, timeout=None):
+        if timeout is None:
+            raise RuntimeError('Simulation deadlock: nothing is scheduled')
+
+        self.loop.advance(timeout)
+        return []
+
+    def close(self):
+        pass
+
+
+class SimulatedEventLoop(asyncio.BaseEventLoop):
+    """Event loop with virtual time
+
+    Callbacks run in the usual order, but whenever there is nothing ready to run
+    the clock jumps straight to the next scheduled callback, so heartbeats, election timeouts
+    and network delays cost no real time at all. Set it as the current event loop
+    before creating Timers or registering nodes.
+    """
+
+    def __init__(self, start_time=0.0):
+        super().__init__()
+        self._time = start_time
+        self._selector = _VirtualSelector(self)
+
+    def time(self):
+        return self._time
+
+    def advance(self, seconds):
+        self._time += max(seconds, 0)
+
+    def run_for(self, seconds):
+        """Run the loop for <seconds> of virtual time"""
+        future = self.create_future()
+        self.call_later(seconds, future.set_result, None)
+        self.run_until_complete(future)
+
+    def _process_events(self, event_list):
+        pass
+
+    def _write_to_self(self):
+        pass
+
+
+class MemoryTransport:
+    """asyncio.DatagramTransport look-alike bound to a SimulatedNetwork address"""
+
+    def __init__(self, network, address, protocol):
+        self.network = network
+        self.address = address
+        self.protocol = protocol
+        self._closing = False
+
+    def sendto(self, data, addr):
+        self.network.deliver(data, self.address, addr)
+
+    def is_closing(self):
+        return self._closing
+
+    def close(self):
+        self._closing = True
+        self.network.endpoints.pop(self.address, None)
+
+    def get_extra_info(self, name, default=None):
+        if name == 'sockname':
+            return self.address
+
+        return default
+
+
+class SimulatedNetwork:
+    """In-process replacement for UDP with seeded delay, drop, reorder and partitions
+
+    Pass it to raftos.register(..., network=network) instead of using real sockets:
+    every datagram is delivered via loop.call_later after a random delay.
+
+    Args:
+        loop — event loop (usually SimulatedEventLoop)
+        seed — seed for every random decision, same seed gives the same run
+        delay — (min, max) one-way latency in seconds
+        drop_rate — probability of losing a datagram
+        reorder_rate — probability of holding a datagram back for up to <reorder_delay>
+        reorder_delay — extra latency of reordered datagrams
+    """
+
+    def __init__(self, loop, seed=None, delay=(0.001, 0.005), drop_rate=0.0,
+                 reorder_rate=0.0, reorder_delay=0.05):
+        self.loop = loop
+        self.random = random.Random(seed)
+
+        self.delay = delay
+        self.drop_rate = drop_rate
+        self.reorder_rate = reorder_rate
+        self.reorder_delay = reorder_delay
+
+        self.endpoints = {}
+        self.partitions = []
+
+        self.stats = {
+            'sent': 0,
+            'delivered': 0,
+            'dropped': 0,
+            'partitioned': 0
+        }
+
+    async def create_datagram_endpoint(self, protocol_factory, local_addr):
+        if local_addr in self.endpoints:
+            raise OSError('Address {}:{} is already in use'.format(*local_addr))
+
+        protocol = protocol_factory()
+        transport = MemoryTransport(self, local_addr, protocol)
+        self.endpoints[local_addr] = transport
+        protocol.connection_made(transport)
+        return transport, protocol
+
+    def partition(self, *groups):
+        """Split the network: datagrams between different groups are lost
+        Args:
+            groups — iterables of addresses, e.g. [('127.0.0.1', 8000)], [('127.0.0.1', 8001), ...]
+        """
+        self.partitions = [set(group) for group in groups]
+
+    def isolate(self, address):
+        """Cut a single node off the rest of the cluster"""
+        self.partition([address], set(self.endpoints) - {address})
+
+    def heal(self):
+        self.partitions = []
+
+    def is_reachable(self, source, destination):
+        for group in self.partitions:
+            if (source in group) != (destination in group):
+                return False
+
+        return True
+
+    def deliver(self, data, source, destination):
+        self.stats['sent'] += 1
+
+        if not self.is_reachable(source, destination):
+            self.stats['partitioned'] += 1
+            return
+
+        if self.random.random() < self.drop_rate:
+            self.stats['dropped'] += 1
+            return
+
+        delay = self.random.uniform(*self.delay)
+        if self.random.random() < self.reorder_rate:
+            delay += self.random.uniform(0, self.reorder_delay)
+
+        self.loop.call_later(delay, self._receive, data, source, destination)
+
+    def _receive(self, data, source, destination):
+        transport = self.endpoints.get(destination)
+        if transport is None or transport.is_closing() or not self.is_reachable(source, destination):
+            self.stats['dropped'] += 1
+            return
+
+        self.stats['delivered'] += 1
+        transport.protocol.datagram_received(data, source)
@@ -1,11 +1,21 @@
 import asyncio
 import functools
+from collections import OrderedDict
+import itertools
+import os
 import random
+import uuid
 
+from .backup import Backup
+from .cache import ReadCache
 from .conf import config
-from .exceptions import NotALeaderException
+from .exceptions import NotALeaderException, PreconditionFailedException, SessionExpiredException
+from .messages import MESSAGE_TYPES
+from .rtt import RTTMonitor
+from .session import ClientSession
 from .storage import FileStorage, Log, StateMachine
 from .timer import Timer
+from .watch import ChangeFeed
 
 
 def validate_term(func):
@@ -19,8 +29,10 @@ def validate_term(func):
     @functools.wraps(func)
     def on_receive_function(self, data):
         if self.storage.term < data['term']:
+            # One vote per term: followers (witnesses above all) vote again in the new term
             self.storage.update({
-                'term': data['term']
+                'term': data['term'],
+                'voted_for': None
             })
             if not isinstance(self, Follower):
                 self.state.to_follower()
@@ -44,19 +56,40 @@ def validate_commit_index(func):
 
     @functools.wraps(func)
     def wrapped(self, *args, **kwargs):
+        if self.state_machine is None:
+            # Witness: there is nothing to apply
+            self.log.last_applied = self.log.commit_index
+
         for not_applied in range(self.log.last_applied + 1, self.log.commit_index + 1):
-            self.state_machine.apply(self.log[not_applied]['command'])
+            result = self.state_machine.apply(self.log[not_applied]['command'], not_applied)
             self.log.last_applied += 1
 
             try:
-                self.apply_future.set_result(not_applied)
-            except (asyncio.futures.InvalidStateError, AttributeError):
+                self.apply_futures.pop(not_applied).set_result(result)
+            except (asyncio.InvalidStateError, KeyError, AttributeError):
                 pass
 
         return func(self, *args, **kwargs)
     return wrapped
 
 
+def stamp_clock(command, clock):
+    """Operations with the clock argument set to None get the leader's clock,
+    so every State Machine sees the same time in the log
+    """
+    if not isinstance(command, list):
+        return command
+
+    operation, arguments = command
+    if operation == 'session':
+        return [operation, dict(arguments, command=stamp_clock(arguments['command'], clock))]
+
+    if 'clock' in arguments and arguments['clock'] is None:
+        return [operation, dict(arguments, clock=clock)]
+
+    return command
+
+
 class BaseState:
     def __init__(self, state):
         self.state = state
@@ -68,6 +101,12 @@ class BaseState:
         self.id = self.state.id
         self.loop = self.state.loop
 
+        # Dispatch table {<message type>: handler}
+        self.handlers = {
+            message_type: getattr(self, 'on_receive_{}'.format(message_type))
+            for message_type in MESSAGE_TYPES
+        }
+
     @validate_term
     def on_receive_request_vote(self, data):
         """RequestVote RPC — invoked by Candidate to gather votes
@@ -118,6 +157,19 @@ class BaseState:
     def on_receive_append_entries_response(self, data):
         """AppendEntries RPC response — description above"""
 
+    def on_receive_forward_request(self, data):
+        """Follower forwards State call to the leader — we are not a leader (anymore)"""
+        response = {
+            'type': 'forward_request_response',
+            'request_id': data['request_id'],
+            'error': 'NotALeaderException',
+            'message': 'Leader is {}!'.format(self.state.get_leader() or 'not chosen yet')
+        }
+        asyncio.ensure_future(self.state.send(response, data['sender']), loop=self.loop)
+
+    def on_receive_forward_request_response(self, data):
+        self.state.on_forward_response(data)
+
 
 class Leader(BaseState):
     """Raft Leader
@@ -135,24 +187,60 @@ class Leader(BaseState):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        self.heartbeat_timer = Timer(config.heartbeat_interval, self.heartbeat)
+        self.heartbeat_timer = Timer(self.heartbeat_interval, self.heartbeat)
         self.step_down_timer = Timer(
-            config.step_down_missed_heartbeats * config.heartbeat_interval,
+            lambda: self.heartbeat_interval() * config.step_down_missed_heartbeats,
             self.state.to_follower
         )
 
+        # When the last AppendEntries was sent to each follower, heartbeats skip those contacted recently
+        self.last_sent = {}
+
+        # AppendEntries with entries waiting for the response {<follower>: [<entry index>, <when it was sent>]},
+        # one per follower: the next one is sent once the entry is stored, rejected or the response is overdue.
+        # Sent time is None while the message waits for space in the outbound queue
+        self.in_flight = {}
+
+        # When the last command was received, the cluster is idle <idle_timeout> seconds later
+        self.last_command = self.loop.time()
+
+        # Round trip times of AppendEntries per follower
+        self.rtt = RTTMonitor(self.loop)
+
+        # Proposes deletion of expired names, see StateMachine.apply_expire
+        self.expiry_timer = Timer(config.expiry_interval, self.expire)
+        self.expiring = False
+
+        # Responses per heartbeat round {<request_id>: {<follower>, ...}}, the recent rounds only
         self.request_id = 0
-        self.response_map = {}
+        self.response_map = OrderedDict()
+
+        # When each follower responded last
+        self.last_contact = {}
+
+        # Futures of commands waiting to be applied {<log index>: future}
+        self.apply_futures = {}
 
     def start(self):
+        # Previous leader may have advertised its tuned or idle interval
+        self.state.heartbeat_interval = config.heartbeat_interval
+
         self.init_log()
         self.heartbeat()
         self.heartbeat_timer.start()
         self.step_down_timer.start()
+        self.expiry_timer.start()
 
     def stop(self):
         self.heartbeat_timer.stop()
         self.step_down_timer.stop()
+        self.expiry_timer.stop()
+
+        # Commands may still be committed by the next leader, but we can't tell clients anymore
+        for future in self.apply_futures.values():
+            if not future.done():
+                future.set_exception(NotALeaderException('Leader stepped down!'))
+        self.apply_futures = {}
 
     def init_log(self):
         self.log.next_index = {
@@ -163,10 +251,12 @@ class Leader(BaseState):
             follower: 0 for follower in self.state.cluster
         }
 
-    async def append_entries(self, destination=None):
+    async def append_entries(self, destination=None, heartbeat=False):
         """AppendEntries RPC — replicate log entries / heartbeat
         Args:
             destination — destination id
+            heartbeat — followers waiting for the response to entries get an empty AppendEntries,
+                otherwise they are skipped
 
         Request params:
             term — leader’s term
@@ -181,6 +271,10 @@ class Leader(BaseState):
         # Send AppendEntries RPC to destination if specified or broadcast to everyone
         destination_list = [destination] if destination else self.state.cluster
         for destination in destination_list:
+            replicating = self.is_replicating(destination)
+            if replicating and not heartbeat:
+                continue
+
             data = {
                 'type': 'append_entries',
 
@@ -188,29 +282,62 @@ class Leader(BaseState):
                 'leader_id': self.id,
                 'commit_index': self.log.commit_index,
 
-                'request_id': self.request_id
+                'request_id': self.request_id,
+                'heartbeat_interval': self.heartbeat_interval()
             }
 
             next_index = self.log.next_index[destination]
             prev_index = next_index - 1
 
-            if self.log.last_log_index >= next_index:
-                data['entries'] = [self.log[next_index]]
+            if self.log.last_log_index >= next_index and not replicating:
+                entry = self.log[next_index]
+                if destination in config.witnesses:
+                    entry = {'term': entry['term'], 'command': None}
+
+                data['entries'] = [entry]
 
             else:
                 data['entries'] = []
 
             data.update({
                 'prev_log_index': prev_index,
-                'prev_log_term': self.log[prev_index]['term'] if self.log and prev_index else 0
+                'prev_log_term': self.log.term(prev_index) if self.log and prev_index else 0
             })
 
-            asyncio.ensure_future(self.state.send(data, destination), loop=self.loop)
+            self.rtt.sent(destination, self.request_id)
+            self.last_sent[destination] = self.loop.time()
+
+            if data['entries']:
+                self.in_flight[destination] = sent = [next_index, None]
+                asyncio.ensure_future(self.replicate(data, destination, sent), loop=self.loop)
+            else:
+                asyncio.ensure_future(self.state.send(data, destination), loop=self.loop)
+
+    async def replicate(self, data, destination, sent):
+        """Send AppendEntries with entries, the response is awaited from the moment it's queued"""
+        try:
+            await self.state.send(data, destination)
+        finally:
+            sent[1] = self.loop.time()
+
+    def is_replicating(self, destination):
+        """True if destination hasn't responded to entries yet (within the heartbeat interval)"""
+        if destination not in self.in_flight:
+            return False
+
+        index, sent = self.in_flight[destination]
+        if sent is not None and self.loop.time() - sent > self.heartbeat_interval():
+            del self.in_flight[destination]
+            return False
+
+        return True
 
     @validate_commit_index
     @validate_term
     def on_receive_append_entries_response(self, data):
         sender_id = self.state.get_sender_id(data['sender'])
+        self.rtt.received(sender_id, data['request_id'])
+        self.last_contact[sender_id] = self.loop.time()
 
         # Count all unqiue responses per particular heartbeat interval
         # and step down via <step_down_timer> if leader doesn't get majority of responses for
@@ -223,6 +350,12 @@ class Leader(BaseState):
                 self.step_down_timer.reset()
                 del self.response_map[data['request_id']]
 
+        # Entries were stored or rejected, the follower may get the next ones
+        if sender_id in self.in_flight and (
+            not data['success'] or data['last_log_index'] >= self.in_flight[sender_id][0]
+        ):
+            del self.in_flight[sender_id]
+
         if not data['success']:
             self.log.next_index[sender_id] = max(self.log.next_index[sender_id] - 1, 1)
 
@@ -239,16 +372,18 @@ class Leader(BaseState):
             asyncio.ensure_future(self.append_entries(destination=sender_id), loop=self.loop)
 
     def update_commit_index(self):
+        voters = self.commit_voters()
+
         commited_on_majority = 0
         for index in range(self.log.commit_index + 1, self.log.last_log_index + 1):
             commited_count = len([
-                1 for follower in self.log.match_index
+                1 for follower in voters
                 if self.log.match_index[follower] >= index
             ])
 
             # If index is matched on at least half + self for current term — commit
             # That may cause commit fails upon restart with stale logs
-            is_current_term = self.log[index]['term'] == self.storage.term
+            is_current_term = self.log.term(index) == self.storage.term
             if self.state.is_majority(commited_count + 1) and is_current_term:
                 commited_on_majority = index
 
@@ -258,19 +393,148 @@ class Leader(BaseState):
         if commited_on_majority > self.log.commit_index:
             self.log.commit_index = commited_on_majority
 
+    def commit_voters(self):
+        """Followers whose match_index counts towards commits
+        Witnesses count only while less than a majority of full replicas (self included)
+        responded within the step down interval, otherwise entries are committed by full replicas alone
+        """
+        replicas = [follower for follower in self.log.match_index if follower not in config.witnesses]
+        responsive = [
+            follower for follower in replicas
+            if self.loop.time() - self.last_contact.get(follower, float('-inf')) < self.state.step_down_interval()
+        ]
+        if 2 * (len(responsive) + 1) > len(replicas) + 1:
+            return replicas
+
+        return list(self.log.match_index)
+
     async def execute_command(self, command):
-        """Write to log & send AppendEntries RPC"""
-        self.apply_future = asyncio.Future(loop=self.loop)
+        """Write to log & send AppendEntries RPC, return the result of applying command to State Machine"""
+        was_idle = self.is_idle()
+        self.last_command = self.loop.time()
+        if was_idle:
+            # Followers adopt the shorter interval (and election timeouts) with the next message
+            self.heartbeat_timer.reset()
 
-        entry = self.log.write(self.storage.term, command)
+        self.log.write(self.storage.term, stamp_clock(command, config.clock()))
+
+        apply_future = asyncio.Future(loop=self.loop)
+        self.apply_futures[self.log.last_log_index] = apply_future
         asyncio.ensure_future(self.append_entries(), loop=self.loop)
 
-        await self.apply_future
+        return await apply_future
+
+    def on_receive_forward_request(self, data):
+        asyncio.ensure_future(self.execute_forwarded(data), loop=self.loop)
+
+    async def execute_forwarded(self, data):
+        """Run State call forwarded by a follower & send back the result or the error"""
+        response = {
+            'type': 'forward_request_response',
+            'request_id': data['request_id']
+        }
+
+        try:
+            method = forwarded_methods[data['method']]
+            response['result'] = await method(self.state.__class__, *data['args'], **data['kwargs'])
+        except Exception as exc:
+            # Arguments rebuild the same exception on the follower, e.g. KeyError('name')
+            known = exc.__class__.__name__ in self.state.forwarded_exceptions
+            response.update({
+                'error': exc.__class__.__name__,
+                'message': str(exc),
+                'args': list(exc.args) if known else None
+            })
+
+        await self.state.send(response, data['sender'])
 
     def heartbeat(self):
+        """Empty AppendEntries to followers which got none within half of the (non-idle) interval,
+        so nobody waits longer than 1.5 intervals. Responses to replication count toward
+        the step down quorum just like responses to heartbeats
+        """
+        if config.auto_tune_timeouts:
+            self.tune_timeouts()
+
         self.request_id += 1
         self.response_map[self.request_id] = set()
-        asyncio.ensure_future(self.append_entries(), loop=self.loop)
+
+        # Rounds which never got the majority: older ones can't keep the leader from stepping down anyway
+        while len(self.response_map) > config.step_down_missed_heartbeats:
+            self.response_map.popitem(last=False)
+
+        recently = self.loop.time() - self.state.heartbeat_interval / 2
+        for follower in self.state.cluster:
+            if self.last_sent.get(follower, 0) < recently:
+                asyncio.ensure_future(self.append_entries(destination=follower, heartbeat=True), loop=self.loop)
+
+    def heartbeat_interval(self):
+        """Configured (or tuned) interval, <idle_heartbeat_interval> if the cluster is idle"""
+        if self.is_idle():
+            return max(self.state.heartbeat_interval, config.idle_heartbeat_interval)
+
+        return self.state.heartbeat_interval
+
+    def peers(self):
+        """Replication progress & health of every follower"""
+        now = self.loop.time()
+        rtt = self.rtt.stats()
+
+        peers = {}
+        for follower in self.state.cluster:
+            match_index = self.log.match_index[follower]
+            peers[follower] = {
+                'witness': follower in config.witnesses,
+
+                # Seconds since the last response (None if there was none)
+                'last_contact': now - self.last_contact[follower] if follower in self.last_contact else None,
+
+                'next_index': self.log.next_index[follower],
+                'match_index': match_index,
+
+                # Leader's log entries the follower doesn't have yet and their size on disk
+                'lag_entries': self.log.last_log_index - match_index,
+                'lag_bytes': self.log.size - self.log.offset(match_index + 1),
+
+                # Rounds unanswered within the step down window
+                'in_flight': self.rtt.in_flight(
+                    follower, self.heartbeat_interval() * config.step_down_missed_heartbeats
+                ),
+
+                'rtt': rtt.get(follower)
+            }
+
+        return peers
+
+    def is_idle(self):
+        return bool(config.idle_heartbeat_interval) and (
+            self.loop.time() - self.last_command > config.idle_timeout
+        )
+
+    def tune_timeouts(self):
+        """Heartbeat interval from RTT percentile to followers, election timeouts of every node follow it"""
+        heartbeat_interval = self.rtt.heartbeat_interval(
+            config.auto_tune_percentile, config.auto_tune_heartbeat_bounds, config.auto_tune_min_samples
+        )
+        if heartbeat_interval is not None:
+            self.state.heartbeat_interval = heartbeat_interval
+
+    def expire(self):
+        """Propose a single expiry entry if anything is due, nothing is written otherwise"""
+        next_expiry = self.state_machine.next_expiry()
+        if self.expiring or next_expiry is None or next_expiry > config.clock():
+            return
+
+        asyncio.ensure_future(self._expire(), loop=self.loop)
+
+    async def _expire(self):
+        self.expiring = True
+        try:
+            await self.execute_command(['expire', {'clock': None}])
+        except NotALeaderException:
+            pass
+        finally:
+            self.expiring = False
 
 
 class Candidate(BaseState):
@@ -288,7 +552,7 @@ class Candidate(BaseState):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        self.election_timer = Timer(self.election_interval, self.state.to_follower)
+        self.election_timer = Timer(self.state.election_interval, self.state.to_follower)
         self.vote_count = 0
 
     def start(self):
@@ -341,10 +605,6 @@ class Candidate(BaseState):
         if self.storage.term == data['term']:
             self.state.to_follower()
 
-    @staticmethod
-    def election_interval():
-        return random.uniform(*config.election_interval)
-
 
 class Follower(BaseState):
     """Raft Follower
@@ -352,12 +612,14 @@ class Follower(BaseState):
     — Respond to RPCs from candidates and leaders
     — If election timeout elapses without receiving AppendEntries RPC from current leader
     or granting vote to candidate: convert to candidate
+
+    Witnesses never become candidates: they only vote and acknowledge entries
     """
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        self.election_timer = Timer(self.election_interval, self.start_election)
+        self.election_timer = Timer(self.state.election_interval, self.start_election)
 
     def start(self):
         self.init_storage()
@@ -377,20 +639,20 @@ class Follower(BaseState):
             'voted_for': None
         })
 
-    @staticmethod
-    def election_interval():
-        return random.uniform(*config.election_interval)
-
     @validate_commit_index
     @validate_term
     def on_receive_append_entries(self, data):
         self.state.set_leader(data['leader_id'])
 
+        # Election timeouts follow the heartbeat interval advertised by the leader
+        if data['heartbeat_interval']:
+            self.state.heartbeat_interval = data['heartbeat_interval']
+
         # Reply False if log doesn’t contain an entry at prev_log_index whose term matches prev_log_term
         try:
             prev_log_index = data['prev_log_index']
             if prev_log_index > self.log.last_log_index or (
-                prev_log_index and self.log[prev_log_index]['term'] != data['prev_log_term']
+                prev_log_index and self.log.term(prev_log_index) != data['prev_log_term']
             ):
                 response = {
                     'type': 'append_entries_response',
@@ -409,7 +671,7 @@ class Follower(BaseState):
         is_append = True
         new_index = data['prev_log_index'] + 1
         try:
-            if self.log[new_index]['term'] != data['entries'][0]['term']:
+            if self.log.term(new_index) != data['entries'][0]['term']:
                 self.log.erase_from(new_index)
             else:
                 # Ensure that matching entries are not erased and appended again
@@ -468,20 +730,39 @@ class Follower(BaseState):
             asyncio.ensure_future(self.state.send(response, data['sender']), loop=self.loop)
 
     def start_election(self):
-        self.state.to_candidate()
+        # Witnesses only vote, the timer is restarted by every AppendEntries anyway
+        if not self.state.is_witness:
+            self.state.to_candidate()
+
+
+# Functions which can be called on the leader by followers {<name>: function}
+forwarded_methods = {}
 
 
 def leader_required(func):
+    """Runs function on the leader: locally if we are the leader,
+    otherwise forwards the call to the leader and returns its result.
+    Waits <election_wait_timeout> for the election to finish if there is no leader
+    """
+
+    forwarded_methods[func.__name__] = func
 
     @functools.wraps(func)
     async def wrapped(cls, *args, **kwargs):
-        await cls.wait_for_election_success()
-        if not isinstance(cls.leader, Leader):
+        try:
+            await asyncio.wait_for(cls.wait_for_election_success(), config.election_wait_timeout)
+        except asyncio.TimeoutError:
+            pass
+
+        if isinstance(cls.leader, Leader):
+            return await func(cls, *args, **kwargs)
+
+        if cls.leader is None or not config.forward_requests:
             raise NotALeaderException(
                 'Leader is {}!'.format(cls.leader or 'not chosen yet')
             )
 
-        return await func(cls, *args, **kwargs)
+        return await cls.instance.forward(func.__name__, args, kwargs)
     return wrapped
 
 
@@ -500,14 +781,57 @@ class State:
     wait_until_leader_id = None
     wait_until_leader_future = None
 
+    # Local State (the last one registered in this process)
+    instance = None
+
+    # Requests of this process are numbered within the session to apply retries only once, see get_session
+    session = None
+
+    # Exceptions raised on the leader are re-raised on a follower
+    forwarded_exceptions = {
+        exception.__name__: exception
+        for exception in (
+            KeyError, TypeError, ValueError,
+            NotALeaderException, PreconditionFailedException, SessionExpiredException
+        )
+    }
+
     def __init__(self, server):
         self.server = server
         self.id = self._get_id(server.host, server.port)
         self.__class__.loop = self.server.loop
+        self.__class__.instance = self
 
         self.storage = FileStorage(self.id)
         self.log = Log(self.id)
-        self.state_machine = StateMachine(self.id)
+
+        # Witness log entries are terms only, there is no State Machine to apply them to
+        self.is_witness = self.id in config.witnesses
+        self.state_machine = None if self.is_witness else StateMachine(self.id)
+
+        # Everything up to State Machine checkpoint is already committed & applied
+        last_applied = self.state_machine.last_applied if self.state_machine else 0
+        self.log.commit_index = self.log.last_applied = last_applied
+
+        self.change_feed = ChangeFeed(self.loop, last_index=last_applied)
+
+        # Witnesses apply nothing, so they couldn't invalidate cached values: they always read from the leader
+        self.read_cache = None if self.is_witness else ReadCache()
+
+        # Local lock waiters {(<lock name>, <owner>): future}, resolved with the token when the lock is passed to them
+        self.lock_waiters = {}
+
+        if self.state_machine is not None:
+            self.state_machine.listeners.append(self.change_feed)
+            self.state_machine.listeners.append(self.read_cache)
+            self.state_machine.lock_listeners.append(self.on_lock_change)
+
+        # Calls forwarded to the leader waiting for response {<request_id>: future}
+        self.forward_id = 0
+        self.forward_futures = {}
+
+        # Current heartbeat interval: configured or tuned by the leader (see config.auto_tune_timeouts)
+        self.heartbeat_interval = config.heartbeat_interval
 
         self.state = Follower(self)
 
@@ -522,10 +846,297 @@ class State:
     async def get_value(cls, name):
         return cls.leader.state_machine[name]
 
+    @classmethod
+    async def set_value(cls, name, value, ttl=None):
+        """Args:
+            ttl — seconds until name is deleted (by the replicated clock of the leader)
+        """
+        if ttl is not None:
+            await cls.execute('set_ttl', name=name, value=value, ttl=ttl, clock=None)
+            return
+
+        try:
+            await cls.propose({name: value})
+        finally:
+            cls.invalidate_cached_value(name)
+
     @classmethod
     @leader_required
-    async def set_value(cls, name, value):
-        await cls.leader.execute_command({name: value})
+    async def contains(cls, name, item):
+        """Check membership without sending the whole value"""
+        return item in cls.leader.state_machine.get(name, [])
+
+    @classmethod
+    async def execute(cls, operation, **arguments):
+        """Apply State Machine operation (StateMachine.apply_<operation>) and return its result"""
+        try:
+            return await cls.propose([operation, arguments])
+        finally:
+            # Operations without a name (transactions, bulk loads) may change anything
+            cls.invalidate_cached_value(arguments.get('name'))
+
+    @classmethod
+    async def propose(cls, command):
+        """Replicate command within the client session and return the result of applying it.
+        Retries up to <proposal_retries> times on timeouts & leader changes:
+        State Machine applies the command only once no matter how many times it's proposed.
+        Raise the error of a refused command (e.g. TypeError if increment finds a string),
+        SessionExpiredException if the State Machine has forgotten the session — the next proposals start a new one
+        """
+        session = cls.get_session()
+        sequence = session.start_request()
+        try:
+            for attempt in range(config.proposal_retries + 1):
+                try:
+                    response = await cls.execute_command(session.wrap(sequence, command))
+                    break
+                except (asyncio.TimeoutError, NotALeaderException):
+                    if attempt == config.proposal_retries:
+                        raise
+        finally:
+            session.finish_request(sequence)
+
+        if response.get('error'):
+            if response['error'] == SessionExpiredException.__name__ and cls.session is session:
+                cls.session = ClientSession()
+
+            raise cls.forwarded_exceptions[response['error']](response['message'])
+
+        return response['result']
+
+    @classmethod
+    def get_session(cls):
+        """Client session of this process, created on the first proposal
+        Processes forked after import must not share the parent's one:
+        the State Machine would take their requests for retries of each other
+        """
+        if cls.session is None or cls.session.pid != os.getpid():
+            cls.session = ClientSession()
+
+        return cls.session
+
+    @classmethod
+    @leader_required
+    async def execute_command(cls, command):
+        return await cls.leader.execute_command(command)
+
+    @classmethod
+    @leader_required
+    async def get_version(cls, name):
+        return cls.leader.state_machine.version(name)
+
+    @classmethod
+    @leader_required
+    async def get_versioned_value(cls, name):
+        """Return [value, version], raise KeyError if name is not set"""
+        return [cls.leader.state_machine[name], cls.leader.state_machine.version(name)]
+
+    @classmethod
+    async def get_cached_value(cls, name):
+        """[value, version] from the read cache of this node, read from the leader on a miss
+        (or always if this node is a witness)
+        Raise KeyError if name is not set
+        """
+        if cls.instance is None or cls.instance.read_cache is None:
+            return await cls.get_versioned_value(name)
+
+        read_cache = cls.instance.read_cache
+        try:
+            return list(read_cache.get(name))
+        except KeyError:
+            pass
+
+        # The local State Machine may apply a newer change while the leader's answer is on its way
+        read_cache.reserve(name)
+        try:
+            value, version = await cls.get_versioned_value(name)
+            read_cache.put(name, value, version)
+        finally:
+            read_cache.release(name)
+
+        return [value, version]
+
+    @classmethod
+    def invalidate_cached_value(cls, name=None):
+        """Make the next read of name (everything if None) go to the leader: it's been changed by this node"""
+        if cls.instance is not None and cls.instance.read_cache is not None:
+            cls.instance.read_cache.invalidate(name)
+
+    @classmethod
+    async def compare_and_set(cls, name, version, value):
+        """Set value if name is still at version when the change is applied, return True on success"""
+        return await cls.execute('compare_and_set', name=name, version=version, value=value)
+
+    @classmethod
+    async def apply_transaction(cls, updates=None, deletes=None, conditions=None):
+        """Apply many changes atomically with a single log entry
+        Args:
+            updates — {name: value, ...}
+            deletes — [name, ...]
+            conditions — {name: {'version': version} or {'value': value}, ...}
+                all of them must hold at apply time or nothing is changed (version 0 — name is not set)
+        """
+        result = await cls.execute(
+            'transaction',
+            updates=updates or {},
+            deletes=deletes or [],
+            conditions=conditions or {}
+        )
+
+        if not result['success']:
+            raise PreconditionFailedException(
+                'Precondition for {} failed!'.format(result['failed'])
+            )
+
+    @classmethod
+    async def bulk_load(cls, items, replace=False, chunk_size=Backup.CHUNK_SIZE):
+        """Load many names at once: chunks are staged through the log one by one
+        and become visible together when the last one is committed
+        Args:
+            items — {name: value, ...} or iterable of (name, value) pairs
+            replace — also delete names which were not loaded
+        Returns amount of loaded names
+        """
+        if isinstance(items, dict):
+            items = items.items()
+
+        load_id = uuid.uuid4().hex
+        items = iter(items)
+        try:
+            while True:
+                chunk = [list(item) for item in itertools.islice(items, chunk_size)]
+                if not chunk:
+                    break
+
+                await cls.execute('load', load_id=load_id, items=chunk)
+
+            return await cls.execute('load_commit', load_id=load_id, replace=replace)
+
+        except Exception:
+            await cls.execute('load_abort', load_id=load_id)
+            raise
+
+    @classmethod
+    async def backup(cls, filename):
+        """Save consistent snapshot of the local State Machine without pausing it
+        Returns index of the last log entry included
+        """
+        index, data = cls.local_state_machine().snapshot()
+        await Backup(filename).write(index, data)
+        return index
+
+    @classmethod
+    async def restore(cls, filename, replace=True):
+        """Bulk load a backup made by State.backup"""
+        return await cls.bulk_load(Backup(filename), replace=replace)
+
+    @classmethod
+    async def acquire_lock(cls, name, owner, ttl, timeout=None):
+        """Take the lock for ttl seconds, waiting in FIFO order if it's taken
+        Return the fencing token, raise asyncio.TimeoutError (and leave the queue) after timeout
+
+        Lock hand-overs are seen by the local State Machine, so witnesses can't wait for locks
+        """
+        cls.local_state_machine()
+
+        # Registered before proposing so the lock passed to us right after is not missed
+        future = asyncio.Future(loop=cls.loop)
+        cls.instance.lock_waiters[(name, owner)] = future
+        try:
+            result = await cls.execute(
+                'lock_acquire', name=name, owner=owner, ttl=ttl, clock=None, wait=True
+            )
+            if result['acquired']:
+                return result['token']
+
+            try:
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                await cls.release_lock(name, owner)
+                raise
+        finally:
+            cls.instance.lock_waiters.pop((name, owner), None)
+
+    @classmethod
+    async def release_lock(cls, name, owner):
+        """Pass the lock to the next waiter, return False if owner doesn't have it"""
+        return await cls.execute('lock_release', name=name, owner=owner, clock=None)
+
+    def on_lock_change(self, index, name, lock):
+        """State Machine lock listener"""
+        if lock is None:
+            return
+
+        future = self.lock_waiters.get((name, lock['owner']))
+        if future is not None and not future.done():
+            future.set_result(lock['token'])
+
+    @classmethod
+    def scan(cls, prefix=None, start=None, end=None, limit=None):
+        """Async iterator of (name, value) pairs of the local State Machine ordered by name
+        Args:
+            prefix — only names starting with prefix
+            start, end — only names in [start, end)
+            limit — max amount of names
+        """
+        return cls.local_state_machine().scan(prefix=prefix, start=start, end=end, limit=limit)
+
+    @classmethod
+    def watch(cls, name=None, prefix=None, start_index=None):
+        """Async iterator of changes applied to the local State Machine
+        Args:
+            name — watch a single name
+            prefix — watch every name starting with prefix
+            start_index — also deliver changes applied after this log index
+        """
+        cls.local_state_machine()
+        return cls.instance.change_feed.watch(name=name, prefix=prefix, start_index=start_index)
+
+    @classmethod
+    def local_state_machine(cls):
+        if cls.instance is None:
+            raise RuntimeError('Node is not registered!')
+
+        if cls.instance.state_machine is None:
+            raise RuntimeError('Witness {} has no State Machine!'.format(cls.instance.id))
+
+        return cls.instance.state_machine
+
+    async def forward(self, method, args, kwargs):
+        """Call State method on the leader and wait <forward_timeout> for the result"""
+        self.forward_id += 1
+        request_id = self.forward_id
+
+        future = asyncio.Future(loop=self.loop)
+        self.forward_futures[request_id] = future
+
+        request = {
+            'type': 'forward_request',
+            'request_id': request_id,
+            'method': method,
+            'args': list(args),
+            'kwargs': kwargs
+        }
+
+        try:
+            await self.send(request, self.leader)
+            response = await asyncio.wait_for(future, config.forward_timeout)
+        finally:
+            self.forward_futures.pop(request_id, None)
+
+        if response.get('error'):
+            exception = self.forwarded_exceptions.get(response['error'], RuntimeError)
+
+            # Leaders of earlier versions send the message only
+            args = response.get('args')
+            raise exception(*args) if args is not None else exception(response['message'])
+
+        return response.get('result')
+
+    def on_forward_response(self, data):
+        future = self.forward_futures.get(data['request_id'])
+        if future is not None and not future.done():
+            future.set_result(data)
 
     def send(self, data, destination):
         return self.server.send(data, destination)
@@ -535,7 +1146,7 @@ class State:
         return self.server.broadcast(data)
 
     def request_handler(self, data):
-        getattr(self.state, 'on_receive_{}'.format(data['type']))(data)
+        self.state.handlers[data['type']](data)
 
     @staticmethod
     def _get_id(host, port):
@@ -548,6 +1159,36 @@ class State:
     def cluster(self):
         return [self._get_id(*address) for address in self.server.cluster]
 
+    def step_down_interval(self):
+        return self.heartbeat_interval * config.step_down_missed_heartbeats
+
+    def election_interval(self):
+        """Randomized election timeout
+        [step_down_interval, election_interval_spread * step_down_interval]
+        """
+        return random.uniform(
+            self.step_down_interval(),
+            self.step_down_interval() * config.election_interval_spread
+        )
+
+    @classmethod
+    def get_rtt(cls):
+        """Round trip times to followers {<follower>: {'samples', 'last', 'p50', 'p99'}}, {} if not a leader"""
+        if isinstance(cls.leader, Leader):
+            return cls.leader.rtt.stats()
+
+        return {}
+
+    @classmethod
+    def get_peers(cls):
+        """Status of followers {<follower>: {'witness', 'last_contact', 'next_index', 'match_index',
+        'lag_entries', 'lag_bytes', 'in_flight', 'rtt'}}, {} if not a leader
+        """
+        if isinstance(cls.leader, Leader):
+            return cls.leader.peers()
+
+        return {}
+
     def is_majority(self, count):
         return count > (self.server.cluster_count // 2)
 
@@ -601,8 +1242,11 @@ class State:
     async def wait_for_election_success(cls):
         """Await this function if your cluster must have a leader"""
         if cls.leader is None:
-            cls.leader_future = asyncio.Future(loop=cls.loop)
-            await cls.leader_future
+            if cls.leader_future is None or cls.leader_future.done():
+                cls.leader_future = asyncio.Future(loop=cls.loop)
+
+            # Shielded so one waiter's timeout doesn't cancel the future for everyone else
+            await asyncio.shield(cls.leader_future)
 
     @classmethod
     async def wait_until_leader(cls, node_id):
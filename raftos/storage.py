@@ -1,21 +1,37 @@
+import asyncio
+import heapq
+import itertools
+import numbers
 import os
+import struct
+from array import array
+from collections import OrderedDict
 
 from .conf import config
+from .exceptions import SessionExpiredException
 
 
 class FileDict:
     """Persistent dict-like storage on a disk accessible by obj['item_name']"""
 
-    def __init__(self, filename, serializer=None):
+    def __init__(self, filename, serializer=None, compressor=None):
         self.filename = filename.replace(':', '_')
         os.makedirs(os.path.dirname(self.filename), exist_ok=True)
 
         self.cache = {}
         self.serializer = serializer or config.serializer
+        self.compressor = compressor or config.compressor
 
     def update(self, kwargs):
-        for key, value in kwargs.items():
-            self[key] = value
+        try:
+            content = self._get_file_content()
+        except FileNotFoundError:
+            content = {}
+
+        content.update(kwargs)
+        self._write_file_content(content)
+
+        self.cache = content
 
     def exists(self, name):
         try:
@@ -42,16 +58,7 @@ class FileDict:
         return self.cache[name]
 
     def __setitem__(self, name, value):
-        try:
-            content = self._get_file_content()
-        except FileNotFoundError:
-            content = {}
-
-        content.update({name: value})
-        with open(self.filename, 'wb') as f:
-            f.write(self.serializer.pack(content))
-
-        self.cache = content
+        self.update({name: value})
 
     def _get_file_content(self):
         with open(self.filename, 'rb') as f:
@@ -59,29 +66,62 @@ class FileDict:
             if not content:
                 return {}
 
-        return self.serializer.unpack(content)
+        return self.serializer.unpack(self.compressor.unpack_stored(content))
+
+    def _write_file_content(self, content):
+        """Write to a temporary file and rename it so a crash never leaves a half-written file"""
+        temporary = '{}.tmp'.format(self.filename)
+        with open(temporary, 'wb') as f:
+            f.write(self.compressor.pack(self.serializer.pack(content)))
+
+        os.replace(temporary, self.filename)
 
 
 class Log:
     """Persistent Raft Log on a disk
-    Log entries:
-        {term: <term>, command: <command>}
-        {term: <term>, command: <command>}
+    Log records (after the <MAGIC><VERSION> file header):
+        <term><command length><command>
+        <term><command length><command>
         ...
-        {term: <term>, command: <command>}
+        <term><command length><command>
+
+    Entry index is a corresponding record number starting from _one_.
+    Only terms and file offsets are kept in memory (compact arrays),
+    commands are read from disk on demand and the most recently used entries are cached.
 
-    Entry index is a corresponding line number
+    Terms and offsets are also persisted to <node>.log.index as fixed size records,
+    so restart loads them in one read instead of scanning the log.
+
+    Logs written before records were introduced (serialized entries separated by newlines)
+    are migrated on the first start, files of any other format are never touched
     """
 
-    UPDATE_CACHE_EVERY = 5
+    MAGIC = b'raftos-log'
+    VERSION = 1
+    FILE_HEADER = MAGIC + bytes([VERSION])
+
+    HEADER = struct.Struct('>qI')
+    INDEX_RECORD = struct.Struct('=qq')
 
-    def __init__(self, node_id, serializer=None):
+    # Amount of recently written or read entries kept in memory
+    CACHE_SIZE = 1000
+
+    def __init__(self, node_id, serializer=None, compressor=None):
         self.filename = os.path.join(config.log_path, '{}.log'.format(node_id.replace(':', '_')))
+        self.index_filename = '{}.index'.format(self.filename)
         os.makedirs(os.path.dirname(self.filename), exist_ok=True)
         open(self.filename, 'a').close()
+        open(self.index_filename, 'a').close()
 
         self.serializer = serializer or config.serializer
-        self.cache = self.read()
+        self.compressor = compressor or config.compressor
+        self._check_format()
+
+        self.terms = array('q')
+        self.offsets = array('q')
+        self.size = 0
+        self.cache = OrderedDict()
+        self.read()
 
         # All States
 
@@ -108,64 +148,768 @@ class Log:
         self.match_index = None
 
     def __getitem__(self, index):
-        return self.cache[index - 1]
+        if not 1 <= index <= len(self):
+            raise IndexError('Log index {} is out of range'.format(index))
+
+        if index in self.cache:
+            self.cache.move_to_end(index)
+            return self.cache[index]
+
+        entry = {
+            'term': self.terms[index - 1],
+            'command': self._read_command(index)
+        }
+        self._cache(index, entry)
+        return entry
 
     def __bool__(self):
-        return bool(self.cache)
+        return bool(self.terms)
 
     def __len__(self):
-        return len(self.cache)
+        return len(self.terms)
+
+    def term(self, index):
+        """Term of the entry at index without loading its command"""
+        if not 1 <= index <= len(self):
+            raise IndexError('Log index {} is out of range'.format(index))
+
+        return self.terms[index - 1]
+
+    def offset(self, index):
+        """File offset of the entry at index, log size for the index after the last entry"""
+        if index > len(self):
+            return self.size
+
+        return self.offsets[index - 1]
 
     def write(self, term, command):
+        payload = self.compressor.pack(self.serializer.pack(command))
         with open(self.filename, 'ab') as f:
-            entry = {
-                'term': term,
-                'command': command
-            }
-            f.write(self.serializer.pack(entry) + '\n'.encode())
+            f.write(self.HEADER.pack(term, len(payload)) + payload)
+
+        with open(self.index_filename, 'ab') as f:
+            f.write(self.INDEX_RECORD.pack(term, self.size))
 
-        self.cache.append(entry)
-        if not len(self) % self.UPDATE_CACHE_EVERY:
-            self.cache = self.read()
+        entry = {
+            'term': term,
+            'command': command
+        }
+        self.terms.append(term)
+        self.offsets.append(self.size)
+        self.size += self.HEADER.size + len(payload)
 
+        self._cache(len(self), entry)
         return entry
 
+    def _check_format(self):
+        """Write the file header to a new log, migrate a legacy one,
+        raise ValueError if the log is of an unknown format or version
+        """
+        with open(self.filename, 'rb') as f:
+            header = f.read(len(self.FILE_HEADER))
+
+        if header == self.FILE_HEADER:
+            return
+
+        if header.startswith(self.MAGIC):
+            raise ValueError('{} has unsupported log format version {}'.format(
+                self.filename, header[len(self.MAGIC):]
+            ))
+
+        if header:
+            self._migrate()
+            return
+
+        with open(self.filename, 'wb') as f:
+            f.write(self.FILE_HEADER)
+
+        open(self.index_filename, 'wb').close()
+
+    def _migrate(self):
+        """Rewrite legacy log (<serialized entry>\\n per entry) in the current format"""
+        entries = []
+        with open(self.filename, 'rb') as f:
+            # Serialized entries may contain newline bytes: lines are joined until they make an entry
+            pending = b''
+            for line in f:
+                pending += line
+                try:
+                    entry = self.serializer.unpack(pending[:-1])
+                except Exception:
+                    continue
+
+                if not isinstance(entry, dict) or set(entry) != {'term', 'command'}:
+                    break
+
+                entries.append(entry)
+                pending = b''
+
+        if pending or not entries:
+            raise ValueError('{} is not a raftos log, refusing to start'.format(self.filename))
+
+        temporary = '{}.tmp'.format(self.filename)
+        with open(temporary, 'wb') as f:
+            f.write(self.FILE_HEADER)
+            for entry in entries:
+                payload = self.compressor.pack(self.serializer.pack(entry['command']))
+                f.write(self.HEADER.pack(entry['term'], len(payload)) + payload)
+
+        # Index is rebuilt from the log by read()
+        open(self.index_filename, 'wb').close()
+        os.replace(temporary, self.filename)
+
     def read(self):
+        """Restore terms & offsets from the index file, commands are not deserialized.
+        Records missing from the index (e.g. crash between log and index writes) are recovered
+        by hopping over log record headers, incomplete record left by a crash is cut off
+        """
+        self.cache.clear()
+        self.terms, self.offsets = self._read_index()
+        indexed = len(self.terms)
+
         with open(self.filename, 'rb') as f:
-            return [self.serializer.unpack(entry) for entry in f.readlines()]
+            file_size = os.fstat(f.fileno()).st_size
+
+            # Drop index records pointing to data which is not in the log (anymore)
+            offset = None
+            while self.terms:
+                offset = self._record_end(f, self.terms[-1], self.offsets[-1], file_size)
+                if offset is not None:
+                    break
+
+                self.terms.pop()
+                self.offsets.pop()
+
+            offset = offset or len(self.FILE_HEADER)
+            while True:
+                f.seek(offset)
+                header = f.read(self.HEADER.size)
+                if len(header) < self.HEADER.size:
+                    break
+
+                term, _ = self.HEADER.unpack(header)
+                end = self._record_end(f, term, offset, file_size)
+                if end is None:
+                    break
+
+                self.terms.append(term)
+                self.offsets.append(offset)
+                offset = end
+
+        if offset != file_size:
+            os.truncate(self.filename, offset)
+
+        if len(self.terms) != indexed:
+            self._write_index()
+
+        self.size = offset
+
+    def _read_index(self):
+        records = array('q')
+        with open(self.index_filename, 'rb') as f:
+            content = f.read()
+
+        records.frombytes(content[:len(content) - len(content) % self.INDEX_RECORD.size])
+        return records[0::2], records[1::2]
+
+    def _write_index(self):
+        records = array('q', [0]) * (2 * len(self.terms))
+        records[0::2] = self.terms
+        records[1::2] = self.offsets
+
+        temporary = '{}.tmp'.format(self.index_filename)
+        with open(temporary, 'wb') as f:
+            f.write(records.tobytes())
+
+        os.replace(temporary, self.index_filename)
+
+    def _record_end(self, f, term, offset, file_size):
+        """End offset of a complete log record with given term starting at offset or None"""
+        if offset + self.HEADER.size > file_size:
+            return None
+
+        f.seek(offset)
+        record_term, length = self.HEADER.unpack(f.read(self.HEADER.size))
+        end = offset + self.HEADER.size + length
+        if record_term != term or end > file_size:
+            return None
+
+        return end
 
     def erase_from(self, index):
-        updated = self.cache[:index - 1]
-        open(self.filename, 'wb').close()
-        self.cache = []
+        """Delete entry at index and all that follow it"""
+        if index > len(self):
+            return
+
+        self.size = self.offsets[index - 1]
+        os.truncate(self.filename, self.size)
+        os.truncate(self.index_filename, (index - 1) * self.INDEX_RECORD.size)
 
-        for entry in updated:
-            self.write(entry['term'], entry['command'])
+        del self.terms[index - 1:]
+        del self.offsets[index - 1:]
+        for cached in [cached for cached in self.cache if cached >= index]:
+            del self.cache[cached]
 
     @property
     def last_log_index(self):
         """Index of last log entry staring from _one_"""
-        return len(self.cache)
+        return len(self)
 
     @property
     def last_log_term(self):
-        if self.cache:
-            return self.cache[-1]['term']
+        if self.terms:
+            return self.terms[-1]
 
         return 0
 
+    def _read_command(self, index):
+        offset = self.offsets[index - 1] + self.HEADER.size
+        end = self.offsets[index] if index < len(self) else self.size
 
-class StateMachine(FileDict):
-    """Raft Replicated State Machine — dict"""
+        with open(self.filename, 'rb') as f:
+            f.seek(offset)
+            return self.serializer.unpack(self.compressor.unpack(f.read(end - offset)))
 
-    def __init__(self, node_id):
-        filename = os.path.join(config.log_path, '{}.state_machine'.format(node_id))
-        super().__init__(filename)
+    def _cache(self, index, entry):
+        self.cache[index] = entry
+        self.cache.move_to_end(index)
+        while len(self.cache) > self.CACHE_SIZE:
+            self.cache.popitem(last=False)
+
+
+class StateMachine:
+    """Raft Replicated State Machine — dict
+
+    Commands:
+        {name: value, ...} — set values
+        [<operation>, {<argument>: value, ...}] — call apply_<operation>
+
+    Every name has a version — index of the log entry that changed it last (0 if name is not set).
+    Listeners are called with (index, updates, deletes) for every applied change.
+    Stored by <state_machine_backend> together with versions, client sessions, staged bulk loads,
+    TTLs, locks and the index of the last applied entry (checkpoint),
+    so a restarted node knows what it has already applied and doesn't apply it again
+    """
+
+    # Client sessions are evicted (least recently used first) when there are more of them
+    MAX_SESSIONS = 10000
+
+    # Results of unacknowledged requests kept per session
+    MAX_SESSION_RESULTS = 1000
+
+    def __init__(self, node_id, backend=None):
+        filename = os.path.join(config.log_path, '{}.state_machine'.format(node_id.replace(':', '_')))
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+        self.backend = (backend or config.state_machine_backend)(filename, config)
+        meta = self.backend.load()
+
+        self.last_applied = meta.get('last_applied', 0)
+
+        # Sessions, TTLs & locks are stored in backend tables apart from meta,
+        # keys of changed (or deleted) records {<table>: {key, ...}} are written by the next commit
+        self.changed = {table: set() for table in self.backend.TABLES}
+
+        """Client sessions:
+            {<client_id>: {'acknowledged': <sequence>, 'last_index': <index>, 'results': {<sequence>: result}}}
+        """
+        self.sessions = self._records(meta, 'sessions')
+
+        # Bulk loads not committed yet {<load_id>: <amount of staged names>}, names are staged by the backend
+        self.loads = meta.get('loads', {})
+
+        # Older versions kept staged names in meta
+        for load_id, staged in meta.get('staged', {}).items():
+            self.loads[load_id] = self.backend.stage(load_id, list(staged.items()))
+
+        # Replicated clock — the latest leader's clock seen in the log, never goes back
+        self.clock = meta.get('clock', 0)
+
+        # Names with TTL {name: <clock when it expires>}, heap of (expires, name) finds the next ones to expire.
+        # Heap entries of names that were changed since are skipped
+        self.expiry = self._records(meta, 'expiry')
+        self.expiry_heap = [(expires, name) for name, expires in self.expiry.items()]
+        heapq.heapify(self.expiry_heap)
+
+        """Distributed locks (separate from names):
+            {<name>: {'owner': <owner>, 'token': <index>, 'expires': <clock>, 'waiters': [[<owner>, <ttl>], ...]}}
+        Token is the index of the log entry that granted the lock, so it grows with every new owner
+        """
+        self.locks = self._records(meta, 'locks')
+        self.lock_heap = [(lock['expires'], name) for name, lock in self.locks.items()]
+        heapq.heapify(self.lock_heap)
+
+        self.listeners = []
+
+        # Called with (index, name, lock) when a lock gets a new owner (lock is None if it's free)
+        self.lock_listeners = []
+
+        self.deferred = False
+
+    def _records(self, meta, table):
+        """Saved records of backend table, older versions kept them in meta"""
+        records = self.backend.records(table)
+        for key, value in meta.get(table, {}).items():
+            records[key] = value
+            self.changed[table].add(key)
+
+        return records
+
+    def __getitem__(self, name):
+        return self.backend.get(name)
+
+    def exists(self, name):
+        try:
+            self[name]
+            return True
+
+        except KeyError:
+            return False
+
+    def apply(self, command, index):
+        """Apply command (log entry at index) to State Machine and return the result
+        Commands which can't be applied are refused: the entry is applied anyway, see refuse
+        """
+
+        self.last_applied = index
+
+        if isinstance(command, list):
+            operation, arguments = command
+            apply_operation = getattr(self, 'apply_{}'.format(operation), None)
+            if apply_operation is None:
+                return self.refuse(ValueError, 'Unknown operation {}'.format(operation))
+
+            return apply_operation(index, **arguments)
+
+        if not isinstance(command, dict):
+            return self.refuse(TypeError, 'Command has to be a dict of values or an operation')
+
+        self.write(command, index=index)
+
+    def refuse(self, exception, message):
+        """Result of a command which doesn't fit the stored values, State.propose raises it.
+        Only the checkpoint is written: every node skips the entry the same way instead of failing on it
+        """
+        self.write({})
+        return {'error': exception.__name__, 'message': message}
+
+    @staticmethod
+    def is_refused(result):
+        return isinstance(result, dict) and set(result) == {'error', 'message'}
+
+    def apply_session(self, index, client_id, sequence, acknowledged, command):
+        """Apply command once per (client_id, sequence), duplicates get the saved result
+        Args:
+            acknowledged — client has got results of all requests up to this sequence
+        Returns {'result': <result>} or the error if command is refused (see refuse),
+        SessionExpiredException if the client had a session which is evicted now:
+        its retries can't be recognized anymore
+        """
+        session = self.sessions.get(client_id)
+        if session is None:
+            if acknowledged:
+                return self.refuse(SessionExpiredException, 'Session {} has expired!'.format(client_id))
+
+            session = self.sessions[client_id] = {'acknowledged': 0, 'last_index': index, 'results': {}}
+            self._evict_sessions()
+
+        self.changed['sessions'].add(client_id)
+        session['last_index'] = index
+        session['acknowledged'] = max(session['acknowledged'], acknowledged)
+        session['results'] = {
+            saved: result for saved, result in session['results'].items()
+            if int(saved) > session['acknowledged']
+        }
+
+        # JSON allows string keys only
+        key = str(sequence)
+        if sequence <= session['acknowledged'] or key in session['results']:
+            self.write({})
+            return self._response(session['results'].get(key))
+
+        # Single file write for the command and the session
+        self.deferred = True
+        try:
+            result = self.apply(command, index)
+        finally:
+            self.deferred = False
+
+        session['results'][key] = result
+        while len(session['results']) > self.MAX_SESSION_RESULTS:
+            del session['results'][str(min(map(int, session['results'])))]
+
+        self.write({})
+        return self._response(result)
+
+    def _response(self, result):
+        return result if self.is_refused(result) else {'result': result}
+
+    def _evict_sessions(self):
+        while len(self.sessions) > self.MAX_SESSIONS:
+            oldest = min(self.sessions, key=lambda client_id: self.sessions[client_id]['last_index'])
+            del self.sessions[oldest]
+            self.changed['sessions'].add(oldest)
+
+    def apply_transaction(self, index, updates, deletes, conditions):
+        """Change many names at once if all conditions hold"""
+        for name, condition in conditions.items():
+            if 'version' in condition and condition['version'] != self.version(name) or (
+                'value' in condition and (not self.exists(name) or condition['value'] != self[name])
+            ):
+                self.write({})
+                return {'success': False, 'failed': name}
+
+        self.write(updates, deletes, index=index)
+        return {'success': True}
+
+    def apply_compare_and_set(self, index, name, version, value):
+        """Set value if name is still at version (0 — not set), return False otherwise"""
+        if self.version(name) != version:
+            self.write({})
+            return False
+
+        self.write({name: value}, index=index)
+        return True
+
+    def apply_increment(self, index, name, delta):
+        """Counter: add delta to the value (0 if not set), return the new value"""
+        value = self.get(name, 0)
+        if not isinstance(value, numbers.Number) or not isinstance(delta, numbers.Number):
+            return self.refuse(TypeError, 'Can\'t increment {}: not a number'.format(name))
+
+        value += delta
+        self.write({name: value}, index=index)
+        return value
+
+    def apply_set_add(self, index, name, item):
+        """Set (stored as a list): add item, return False if it's already there"""
+        members = self.get(name, [])
+        if not isinstance(members, list):
+            return self.refuse(TypeError, '{} is not a set'.format(name))
+
+        if item in members:
+            self.write({})
+            return False
+
+        self.write({name: members + [item]}, index=index)
+        return True
+
+    def apply_set_remove(self, index, name, item):
+        """Set (stored as a list): remove item, return False if it's not there"""
+        members = self.get(name, [])
+        if not isinstance(members, list):
+            return self.refuse(TypeError, '{} is not a set'.format(name))
+
+        if item not in members:
+            self.write({})
+            return False
+
+        self.write({name: [member for member in members if member != item]}, index=index)
+        return True
+
+    def apply_queue_push(self, index, name, items):
+        """Queue (stored as a list): append items to the tail, return the new length"""
+        queue = self.get(name, [])
+        if not isinstance(queue, list) or not isinstance(items, (list, tuple)):
+            return self.refuse(TypeError, '{} is not a queue'.format(name))
+
+        queue = queue + list(items)
+        self.write({name: queue}, index=index)
+        return len(queue)
+
+    def apply_queue_pop(self, index, name):
+        """Queue (stored as a list): remove & return the head item"""
+        queue = self.get(name, [])
+        if not isinstance(queue, list):
+            return self.refuse(TypeError, '{} is not a queue'.format(name))
+
+        if not queue:
+            self.write({})
+            return {'empty': True}
+
+        self.write({name: queue[1:]}, index=index)
+        return {'empty': False, 'item': queue[0]}
+
+    def apply_load(self, index, load_id, items):
+        """Bulk load: stage a chunk of [name, value] pairs, nothing is visible until load_commit"""
+        self.loads[load_id] = self.loads.get(load_id, 0) + self.backend.stage(load_id, items)
+        self.write({})
+        return self.loads[load_id]
+
+    def apply_load_commit(self, index, load_id, replace):
+        """Bulk load: make every staged name visible at once
+        Args:
+            replace — also delete names which were not loaded
+        """
+        count = self.loads.pop(load_id, 0)
+
+        # Loads may be huge: changes are reported a page at a time before the backend moves the rows
+        if self.listeners or self.expiry:
+            for updates, deletes in self.backend.load_changes(load_id, replace):
+                self._drop_expiry(itertools.chain(updates, deletes))
+                for listener in self.listeners:
+                    listener(index, updates, deletes)
+
+        self.backend.commit_load(load_id, index, replace)
+        self.write({})
+        return count
+
+    def apply_load_abort(self, index, load_id):
+        self.loads.pop(load_id, None)
+        self.backend.unstage(load_id)
+        self.write({})
+
+    def apply_set_ttl(self, index, name, value, ttl, clock):
+        """Set value which expires when the replicated clock passes clock + ttl (seconds)"""
+        self.clock = max(self.clock, clock)
+        self.write({name: value}, index=index, expiry={name: self.clock + ttl})
+
+    def apply_expire(self, index, clock):
+        """Delete every name expired by clock, return their amount
+        Every node deletes exactly the same names at the same log index
+        """
+        self.clock = max(self.clock, clock)
+        self._expire_locks(index)
+
+        expired = []
+        while self.expiry_heap and self.expiry_heap[0][0] <= self.clock:
+            expires, name = heapq.heappop(self.expiry_heap)
+            if self.expiry.get(name) == expires:
+                expired.append(name)
+
+        self.write({}, expired, index=index)
+        return len(expired)
+
+    def next_expiry(self):
+        """Replicated clock value when the next name or lock lease expires (None if nothing is going to)"""
+        while self.expiry_heap and self.expiry.get(self.expiry_heap[0][1]) != self.expiry_heap[0][0]:
+            heapq.heappop(self.expiry_heap)
+
+        while self.lock_heap and self._lock_expires(self.lock_heap[0][1]) != self.lock_heap[0][0]:
+            heapq.heappop(self.lock_heap)
+
+        due = [heap[0][0] for heap in (self.expiry_heap, self.lock_heap) if heap]
+        return min(due) if due else None
+
+    def apply_lock_acquire(self, index, name, owner, ttl, clock, wait):
+        """Take the lock for ttl seconds (or extend the lease if owner has it already)
+        Args:
+            wait — join the waiters queue if the lock is taken: it's passed to them in FIFO order
+        Returns {'acquired': <bool>, 'token': <fencing token if acquired>}
+        """
+        self.clock = max(self.clock, clock)
+        self._expire_locks(index)
+
+        self.changed['locks'].add(name)
+        lock = self.locks.get(name)
+        if lock is None:
+            lock = self._grant(index, name, owner, ttl, waiters=[])
+
+        elif lock['owner'] == owner:
+            lock['expires'] = self.clock + ttl
+            heapq.heappush(self.lock_heap, (lock['expires'], name))
+
+        elif wait and owner not in [waiter for waiter, _ in lock['waiters']]:
+            lock['waiters'].append([owner, ttl])
+
+        self.write({})
+
+        if lock['owner'] == owner:
+            return {'acquired': True, 'token': lock['token']}
+
+        return {'acquired': False, 'token': None}
+
+    def apply_lock_release(self, index, name, owner, clock):
+        """Pass the lock to the next waiter (or leave the queue if owner is waiting),
+        return False if owner has neither
+        """
+        self.clock = max(self.clock, clock)
+        self._expire_locks(index)
+
+        self.changed['locks'].add(name)
+        lock = self.locks.get(name)
+        released = False
+        if lock is not None:
+            if lock['owner'] == owner:
+                self._release(index, name)
+                released = True
+
+            elif owner in [waiter for waiter, _ in lock['waiters']]:
+                lock['waiters'] = [waiter for waiter in lock['waiters'] if waiter[0] != owner]
+                released = True
+
+        self.write({})
+        return released
+
+    def _grant(self, index, name, owner, ttl, waiters):
+        lock = self.locks[name] = {
+            'owner': owner,
+            'token': index,
+            'expires': self.clock + ttl,
+            'waiters': waiters
+        }
+        self.changed['locks'].add(name)
+        heapq.heappush(self.lock_heap, (lock['expires'], name))
+
+        for listener in self.lock_listeners:
+            listener(index, name, lock)
+
+        return lock
+
+    def _release(self, index, name):
+        lock = self.locks.pop(name)
+        self.changed['locks'].add(name)
+        if lock['waiters']:
+            owner, ttl = lock['waiters'][0]
+            self._grant(index, name, owner, ttl, waiters=lock['waiters'][1:])
+            return
+
+        for listener in self.lock_listeners:
+            listener(index, name, None)
+
+    def _expire_locks(self, index):
+        """Leases run out by the replicated clock are passed on (or released)"""
+        while self.lock_heap and self.lock_heap[0][0] <= self.clock:
+            expires, name = heapq.heappop(self.lock_heap)
+            if self._lock_expires(name) == expires:
+                self._release(index, name)
+
+    def _lock_expires(self, name):
+        lock = self.locks.get(name)
+        return lock['expires'] if lock is not None else None
+
+    def snapshot(self):
+        """Point-in-time copy: (last applied index, mapping of names to values)
+        Applying may go on while the copy is being saved
+        """
+        return self.last_applied, self.backend.snapshot()
+
+    def scan(self, prefix=None, start=None, end=None, limit=None):
+        """Async iterator of (name, value) ordered by name, see Scan"""
+        return Scan(self.backend, prefix=prefix, start=start, end=end, limit=limit)
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def version(self, name):
+        return self.backend.version(name)
+
+    def write(self, updates, deletes=(), index=None, expiry=None):
+        """Set & delete names with a single backend commit
+        Values are replaced, never changed in place. Always writes the checkpoint,
+        even if nothing else changes
+        Args:
+            expiry — {name: <clock when it expires>}, other changed names lose their TTL
+        """
+        self.backend.set(updates, deletes, index)
+        self._drop_expiry(itertools.chain(updates, deletes))
+
+        for name, expires in (expiry or {}).items():
+            self.expiry[name] = expires
+            self.changed['expiry'].add(name)
+            heapq.heappush(self.expiry_heap, (expires, name))
+
+        # Compact stale entries left by names changed before they expired
+        if len(self.expiry_heap) > 2 * len(self.expiry) + 1000:
+            self.expiry_heap = [(expires, name) for name, expires in self.expiry.items()]
+            heapq.heapify(self.expiry_heap)
+
+        if not self.deferred:
+            for table, records in (('sessions', self.sessions), ('expiry', self.expiry), ('locks', self.locks)):
+                changed = self.changed[table]
+                if changed:
+                    self.backend.set_records(
+                        table,
+                        {key: records[key] for key in changed if key in records},
+                        [key for key in changed if key not in records]
+                    )
+                    changed.clear()
+
+            self.backend.commit({
+                'last_applied': self.last_applied,
+                'loads': self.loads,
+                'clock': self.clock
+            })
+
+        if index is not None:
+            for listener in self.listeners:
+                listener(index, updates, deletes)
+
+    def _drop_expiry(self, names):
+        """Changed names lose their TTL"""
+        for name in names:
+            if self.expiry.pop(name, None) is not None:
+                self.changed['expiry'].add(name)
+
+    def update(self, kwargs):
+        self.write(kwargs)
+
+
+class Scan:
+    """Async iterator of State Machine (name, value) pairs ordered by name
+
+    Names are read from the backend BATCH_SIZE at a time, yielding to the event loop in between,
+    so even huge ranges are listed without loading them at once.
+    Each batch reflects the State Machine when it's read
+    Args:
+        prefix — only names starting with prefix
+        start, end — only names in [start, end)
+        limit — max amount of names
+    """
+
+    BATCH_SIZE = 100
+
+    def __init__(self, backend, prefix=None, start=None, end=None, limit=None):
+        self.backend = backend
+        self.prefix = prefix
+        self.start = start
+        self.end = end
+        self.remaining = limit
+
+        if prefix is not None and (start is None or start < prefix):
+            self.start = prefix
+
+        self.batch = []
+        self.finished = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.batch:
+            await self._read_batch()
+
+        if not self.batch:
+            raise StopAsyncIteration
+
+        name, value = self.batch.pop()
+        if self.prefix is not None and not name.startswith(self.prefix):
+            self.batch, self.finished = [], True
+            raise StopAsyncIteration
+
+        if self.remaining is not None:
+            self.remaining -= 1
+
+        return name, value
+
+    async def _read_batch(self):
+        if self.finished or self.remaining == 0:
+            return
+
+        await asyncio.sleep(0)
 
-    def apply(self, command):
-        """Apply command to State Machine"""
+        size = min(self.BATCH_SIZE, self.remaining) if self.remaining is not None else self.BATCH_SIZE
+        batch = self.backend.scan(self.start, self.end, size)
+        if len(batch) < size:
+            self.finished = True
+        elif batch:
+            # The smallest name after the last one
+            self.start = batch[-1][0] + '\0'
 
-        self.update(command)
+        self.batch = batch[::-1]
 
 
 class FileStorage(FileDict):
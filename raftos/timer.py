@@ -2,7 +2,12 @@ import asyncio
 
 
 class Timer:
-    """Scheduling periodic callbacks"""
+    """Scheduling periodic callbacks
+
+    Reset only moves the deadline: a loop handle which is due earlier than the new deadline
+    is kept and, when it fires, reschedules itself for the remaining time.
+    So resetting on every received message costs no event loop scheduling at all
+    """
     def __init__(self, interval, callback):
         self.interval = interval
         self.callback = callback
@@ -10,22 +15,52 @@ class Timer:
 
         self.is_active = False
 
+        self.deadline = None
+        self.handler = None
+        self.handler_deadline = None
+
     def start(self):
         self.is_active = True
-        self.handler = self.loop.call_later(self.get_interval(), self._run)
+        self._schedule(self.loop.time() + self.get_interval())
+
+    def _schedule(self, deadline):
+        self.deadline = deadline
+
+        if self.handler is not None:
+            if self.handler_deadline <= deadline:
+                return
+
+            self.handler.cancel()
+
+        self.handler = self.loop.call_at(deadline, self._run)
+        self.handler_deadline = deadline
 
     def _run(self):
-        if self.is_active:
-            self.callback()
-            self.handler = self.loop.call_later(self.get_interval(), self._run)
+        self.handler = None
+        if not self.is_active:
+            return
+
+        now = self.loop.time()
+        if now < self.deadline:
+            self._schedule(self.deadline)
+            return
+
+        self.callback()
+
+        # Callback may have stopped or reset the timer itself
+        if self.is_active and self.handler is None:
+            self._schedule(now + self.get_interval())
 
     def stop(self):
         self.is_active = False
-        self.handler.cancel()
+        if self.handler is not None:
+            self.handler.cancel()
+            self.handler = None
 
     def reset(self):
-        self.stop()
-        self.start()
+        """Stopped timer stays stopped: a state which was just left may still handle the current message"""
+        if self.is_active:
+            self._schedule(self.loop.time() + self.get_interval())
 
     def get_interval(self):
         return self.interval() if callable(self.interval) else self.interval
@@ -0,0 +1,148 @@
+import asyncio
+import weakref
+from collections import deque
+
+from .exceptions import CompactedIndexException
+
+
+class ChangeFeed:
+    """Changes applied to the local State Machine
+    Keeps a bounded history so watchers can resume from a log index and pushes new changes to them
+
+    Change:
+        {'index': <log index>, 'name': <name>, 'value': <value>, 'deleted': <bool>}
+    """
+
+    # Amount of most recent changes available for resuming watches
+    HISTORY_SIZE = 10000
+
+    def __init__(self, loop, last_index=0):
+        self.loop = loop
+        self.history = deque(maxlen=self.HISTORY_SIZE)
+
+        # Watches abandoned without closing them are garbage collected
+        self.watches = weakref.WeakSet()
+
+        # Changes up to this index are not in history anymore (or were applied before restart)
+        self.compacted_index = last_index
+
+    def __call__(self, index, updates, deletes):
+        """State Machine listener"""
+        changes = [
+            {'index': index, 'name': name, 'value': value, 'deleted': False}
+            for name, value in updates.items()
+        ] + [
+            {'index': index, 'name': name, 'value': None, 'deleted': True}
+            for name in deletes
+        ]
+
+        for change in changes:
+            if len(self.history) == self.history.maxlen:
+                self.compacted_index = self.history[0]['index']
+            self.history.append(change)
+
+            # Overflowing watches close themselves
+            for watch in list(self.watches):
+                watch.push(change)
+
+    def watch(self, name=None, prefix=None, start_index=None):
+        """Subscribe to changes of name (or names starting with prefix, or everything)
+        Args:
+            start_index — also deliver changes applied after this log index
+        """
+        if start_index is not None and start_index < self.compacted_index:
+            raise CompactedIndexException(
+                'Changes before {} are not available!'.format(self.compacted_index + 1)
+            )
+
+        watch = Watch(self, name=name, prefix=prefix)
+        if start_index is not None:
+            for change in self.history:
+                if change['index'] > start_index:
+                    watch.push(change)
+
+        self.watches.add(watch)
+        return watch
+
+
+class Watch:
+    """Async iterator of changes
+
+        async with raftos.watch(prefix='user:') as changes:
+            async for change in changes:
+                ...
+
+    Consumer falling behind by more than PENDING_SIZE changes gets the pending ones
+    and then CompactedIndexException: the rest has to be resumed from the history
+    """
+
+    PENDING_SIZE = 10000
+
+    def __init__(self, feed, name=None, prefix=None):
+        self.feed = feed
+        self.name = name
+        self.prefix = prefix
+
+        self.pending = deque()
+        self.waiter = None
+        self.closed = False
+
+        # start_index to resume from if the watch overflowed
+        self.resume_index = None
+
+    def matches(self, name):
+        if self.name is not None:
+            return name == self.name
+
+        if self.prefix is not None:
+            return isinstance(name, str) and name.startswith(self.prefix)
+
+        return True
+
+    def push(self, change):
+        if self.closed or not self.matches(change['name']):
+            return
+
+        if len(self.pending) >= self.PENDING_SIZE:
+            self.resume_index = change['index'] - 1
+            self.close()
+            return
+
+        self.pending.append(change)
+        self._wake_up()
+
+    def close(self):
+        self.closed = True
+        self.feed.watches.discard(self)
+        self._wake_up()
+
+    async def aclose(self):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self.pending:
+            if self.resume_index is not None:
+                raise CompactedIndexException(
+                    'Watch fell behind, resume with start_index={}'.format(self.resume_index)
+                )
+
+            if self.closed:
+                raise StopAsyncIteration
+
+            self.waiter = asyncio.Future(loop=self.feed.loop)
+            await self.waiter
+
+        return self.pending.popleft()
+
+    def _wake_up(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
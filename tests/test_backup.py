@@ -0,0 +1,63 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+import raftos
+from raftos.backup import Backup
+from raftos.serializers import MessagePackSerializer
+
+
+class TestBackup(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, 'state.backup')
+        raftos.configure({'serializer': MessagePackSerializer})
+
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        shutil.rmtree(self.path)
+
+    def test_write_read(self):
+        data = {'key:{}'.format(i): {'value': i} for i in range(2500)}
+        backup = Backup(self.filename)
+        self.loop.run_until_complete(backup.write(42, data))
+
+        self.assertEqual(backup.read(), {'version': Backup.VERSION, 'index': 42, 'count': 2500})
+        self.assertEqual(dict(backup), data)
+        self.assertFalse(os.path.exists('{}.tmp'.format(self.filename)))
+
+    def test_empty(self):
+        backup = Backup(self.filename)
+        self.loop.run_until_complete(backup.write(0, {}))
+        self.assertEqual(list(backup), [])
+
+    def test_not_a_backup(self):
+        backup = Backup(self.filename)
+        with open(self.filename, 'wb') as f:
+            backup._write_record(f, [['name', 'value']])
+
+        with self.assertRaises(ValueError):
+            backup.read()
+
+    def test_yields_between_chunks(self):
+        ticks = []
+
+        async def tick():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0)
+
+        task = self.loop.create_task(tick())
+        data = {str(i): i for i in range(Backup.CHUNK_SIZE * 5)}
+        self.loop.run_until_complete(Backup(self.filename).write(1, data))
+        task.cancel()
+
+        self.assertGreaterEqual(len(ticks), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+
+from raftos.cache import ReadCache
+
+
+class TestReadCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ReadCache()
+
+    def test_put_keeps_newer(self):
+        self.cache.put('a', 'new', 5)
+        self.cache.put('a', 'old', 3)
+        self.assertEqual(self.cache.get('a'), ('new', 5))
+
+        self.cache.put('a', 'newer', 7)
+        self.assertEqual(self.cache.get('a'), ('newer', 7))
+
+    def test_applied_changes(self):
+        self.cache.put('a', 1, 5)
+        self.cache.put('b', 2, 5)
+
+        # Local State Machine applies entries the leader's value already includes
+        self.cache(4, {'a': 'stale'}, ['b'])
+        self.assertEqual(self.cache.get('a'), (1, 5))
+        self.assertIn('b', self.cache)
+
+        self.cache(6, {'a': 'fresh', 'c': 3}, ['b'])
+        self.assertEqual(self.cache.get('a'), ('fresh', 6))
+        self.assertNotIn('b', self.cache)
+
+        # Only names read before are cached
+        self.assertNotIn('c', self.cache)
+
+    def test_reserved(self):
+        # Changes applied locally while the leader's answer is on its way win over it
+        self.cache.reserve('a')
+        self.cache(6, {'a': 'fresh'}, [])
+        self.cache.put('a', 'old', 5)
+        self.cache.release('a')
+        self.assertEqual(self.cache.get('a'), ('fresh', 6))
+
+        self.cache.reserve('b')
+        self.cache(6, {}, ['b'])
+        self.cache.put('b', 'old', 5)
+        self.cache.release('b')
+        self.assertNotIn('b', self.cache)
+
+        # Unless the answer is newer
+        self.cache.reserve('c')
+        self.cache(6, {'c': 'applied'}, [])
+        self.cache.put('c', 'newer', 7)
+        self.cache.release('c')
+        self.assertEqual(self.cache.get('c'), ('newer', 7))
+        self.assertEqual(self.cache.reserved, {})
+
+    def test_invalidate(self):
+        self.cache.put('a', 1, 1)
+        self.cache.put('b', 2, 2)
+
+        self.cache.invalidate('a')
+        self.assertNotIn('a', self.cache)
+        self.assertIn('b', self.cache)
+
+        self.cache.invalidate()
+        self.assertNotIn('b', self.cache)
+
+    def test_bounded(self):
+        self.cache.SIZE = 2
+        self.cache.put('a', 1, 1)
+        self.cache.put('b', 2, 2)
+        self.cache.get('a')
+        self.cache.put('c', 3, 3)
+
+        self.assertIn('a', self.cache)
+        self.assertNotIn('b', self.cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
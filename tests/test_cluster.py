@@ -0,0 +1,413 @@
+import asyncio
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import raftos
+from raftos.cryptors import DummyCryptor
+from raftos.serializers import MessagePackSerializer
+from raftos.server import Node
+from raftos.simulation import SimulatedEventLoop, SimulatedNetwork
+from raftos.state import Leader, State
+
+
+class SimulatedClusterTestCase(unittest.TestCase):
+    """Whole cluster in one process: simulated network & virtual time"""
+
+    SIZE = 3
+
+    # Amount of witnesses among the last nodes
+    WITNESSES = 0
+
+    def setUp(self):
+        # Election timeouts are randomized with the random module
+        random.seed(1)
+
+        self.log_path = tempfile.mkdtemp()
+        raftos.configure({
+            'log_path': self.log_path,
+            'serializer': MessagePackSerializer,
+            'cryptor': DummyCryptor
+        })
+
+        self.loop = SimulatedEventLoop()
+        raftos.configure({'clock': self.loop.time})
+        asyncio.set_event_loop(self.loop)
+        self.network = SimulatedNetwork(self.loop, seed=1)
+
+        addresses = ['127.0.0.1:{}'.format(8000 + i) for i in range(self.SIZE)]
+        raftos.configure({'witnesses': addresses[self.SIZE - self.WITNESSES:]})
+
+        self.loop.run_until_complete(
+            raftos.register(*addresses, cluster=addresses, loop=self.loop, network=self.network)
+        )
+        self.nodes = list(Node.nodes)
+
+    def tearDown(self):
+        for node in self.nodes:
+            node.stop()
+
+        Node.nodes.clear()
+        raftos.configure({'witnesses': ()})
+        State.leader = State.leader_future = State.instance = State.session = None
+
+        asyncio.set_event_loop(None)
+        self.loop.close()
+        shutil.rmtree(self.log_path)
+
+    @property
+    def leaders(self):
+        return [node for node in self.nodes if isinstance(node.state.state, Leader)]
+
+    def execute(self, command):
+        return self.loop.run_until_complete(self.leaders[0].state.state.execute_command(command))
+
+
+class TestCluster(SimulatedClusterTestCase):
+    def test_election(self):
+        self.loop.run_for(5)
+        self.assertEqual(len(self.leaders), 1)
+
+    def test_replication(self):
+        self.loop.run_for(5)
+        self.assertEqual(self.execute(['increment', {'name': 'counter', 'delta': 2}]), 2)
+        self.loop.run_for(1)
+
+        for node in self.nodes:
+            self.assertEqual(node.state.state_machine['counter'], 2)
+            self.assertEqual(node.state.log.last_applied, 1)
+
+    def test_session_per_process(self):
+        self.loop.run_for(5)
+
+        session = State.get_session()
+        self.assertIs(State.get_session(), session)
+
+        # A process forked after import numbers its requests in its own session
+        with mock.patch('os.getpid', return_value=session.pid + 1):
+            forked = State.get_session()
+        self.assertNotEqual(forked.client_id, session.client_id)
+
+        # Requests with the same sequence from both processes are applied
+        for client_session, value in ((session, 'parent'), (forked, 'child')):
+            command = client_session.wrap(client_session.start_request(), {value: True})
+            self.assertEqual(self.execute(command), {'result': None})
+
+        state_machine = self.leaders[0].state.state_machine
+        self.assertTrue(state_machine['parent'] and state_machine['child'])
+
+    def test_refused_command(self):
+        self.loop.run_for(5)
+        self.execute({'key': 'value'})
+
+        # Committed entry which can't be applied doesn't stop the cluster
+        session = State.get_session()
+        command = session.wrap(session.start_request(), ['increment', {'name': 'key', 'delta': 1}])
+        self.assertEqual(self.execute(command)['error'], 'TypeError')
+
+        self.execute({'key': 'next'})
+        self.loop.run_for(1)
+        for node in self.nodes:
+            self.assertEqual(node.state.log.last_applied, 3)
+            self.assertEqual(node.state.state_machine['key'], 'next')
+
+        # Proposals raise the error
+        async def execute_command(command):
+            return await self.leaders[0].state.state.execute_command(command)
+
+        with mock.patch.object(State, 'execute_command', execute_command):
+            with self.assertRaises(TypeError):
+                self.loop.run_until_complete(State.execute('queue_pop', name='key'))
+
+    def test_one_replication_per_follower(self):
+        self.loop.run_for(5)
+        leader = self.leaders[0].state
+
+        sent = []
+        send = leader.send
+
+        async def count(data, destination):
+            if data.get('entries'):
+                sent.append(destination)
+            await send(data, destination)
+
+        # Concurrent writes don't multiply AppendEntries: the next entry waits for the response to the previous one
+        with mock.patch.object(leader, 'send', count):
+            self.loop.run_until_complete(asyncio.gather(*(
+                leader.state.execute_command({'key': index}) for index in range(8)
+            )))
+            self.loop.run_for(1)
+
+        self.assertEqual(len(sent), 8 * (self.SIZE - 1))
+        for node in self.nodes:
+            self.assertEqual(node.state.log.last_applied, 8)
+
+    def test_failover(self):
+        self.loop.run_for(5)
+        old_leader = self.leaders[0]
+        self.execute({'key': 'before'})
+
+        self.network.isolate((old_leader.host, old_leader.port))
+        self.loop.run_for(30)
+
+        new_leaders = [node for node in self.leaders if node is not old_leader]
+        self.assertEqual(len(new_leaders), 1)
+        self.assertFalse(isinstance(old_leader.state.state, Leader))
+
+        self.loop.run_until_complete(new_leaders[0].state.state.execute_command({'key': 'after'}))
+        # Rejoining node has a higher term and may force another election
+        self.network.heal()
+        self.loop.run_for(20)
+
+        for node in self.nodes:
+            self.assertEqual(node.state.state_machine['key'], 'after')
+
+    def test_ttl(self):
+        self.loop.run_for(5)
+        self.execute(['set_ttl', {'name': 'lease', 'value': 'owner', 'ttl': 3, 'clock': None}])
+        self.execute({'key': 'value'})
+
+        self.loop.run_for(2)
+        for node in self.nodes:
+            self.assertEqual(node.state.state_machine['lease'], 'owner')
+
+        self.loop.run_for(3)
+        indexes = set()
+        for node in self.nodes:
+            self.assertFalse(node.state.state_machine.exists('lease'))
+            self.assertTrue(node.state.state_machine.exists('key'))
+            indexes.add(node.state.log.last_applied)
+
+        # A single expiry entry, applied by every node
+        self.assertEqual(indexes, {3})
+
+    def test_lock_waiters(self):
+        self.loop.run_for(5)
+        follower = next(node for node in self.nodes if node not in self.leaders)
+
+        def acquire(owner):
+            return self.execute([
+                'lock_acquire', {'name': 'lock', 'owner': owner, 'ttl': 3, 'clock': None, 'wait': True}
+            ])
+
+        self.assertTrue(acquire('a')['acquired'])
+        self.assertFalse(acquire('b')['acquired'])
+
+        waiter = asyncio.Future(loop=self.loop)
+        follower.state.lock_waiters[('lock', 'b')] = waiter
+
+        # Holder doesn't release the lock: its lease runs out and the follower is woken up
+        self.loop.run_for(5)
+        self.assertEqual(waiter.result(), 3)
+        for node in self.nodes:
+            self.assertEqual(node.state.state_machine.locks['lock']['owner'], 'b')
+
+    def test_peers(self):
+        self.loop.run_for(10)
+        leader = self.leaders[0]
+        follower = next(node for node in self.nodes if node is not leader)
+
+        self.network.isolate((follower.host, follower.port))
+        for i in range(3):
+            self.execute({'key': i})
+
+        self.loop.run_for(1)
+        state = leader.state.state
+        peers = state.peers()
+        self.assertEqual(len(peers), self.SIZE - 1)
+
+        follower_id = '{}:{}'.format(follower.host, follower.port)
+        lagging = peers[follower_id]
+        self.assertEqual(lagging['lag_entries'], 3)
+        self.assertGreater(lagging['lag_bytes'], 0)
+        self.assertGreaterEqual(lagging['last_contact'], 1)
+        self.assertGreater(lagging['in_flight'], 0)
+
+        for peer in peers.values():
+            if peer is not lagging:
+                self.assertEqual(peer['lag_entries'], 0)
+                self.assertEqual(peer['lag_bytes'], 0)
+                self.assertLess(peer['last_contact'], 0.5)
+                self.assertLess(peer['rtt']['p99'], 0.05)
+
+        # Rounds never answered by the majority are not kept forever
+        for i in range(100):
+            state.heartbeat()
+
+        self.assertEqual(len(state.response_map), raftos.config.step_down_missed_heartbeats)
+
+
+class TestForwarding(SimulatedClusterTestCase):
+    def setUp(self):
+        super().setUp()
+
+        # State keeps the leader per process: give every simulated node its own
+        for node in self.nodes:
+            node.state.__class__ = type('State', (State,), {
+                'leader': None,
+                'leader_future': None,
+                'wait_until_leader_id': None,
+                'wait_until_leader_future': None,
+                'instance': node.state,
+                'session': None
+            })
+
+        self.loop.run_for(5)
+
+    def test_follower(self):
+        follower = next(node.state.__class__ for node in self.nodes if node not in self.leaders)
+
+        self.loop.run_until_complete(follower.set_value('key', 'value'))
+        self.assertEqual(self.loop.run_until_complete(follower.get_value('key')), 'value')
+        self.assertEqual(self.leaders[0].state.state_machine['key'], 'value')
+
+        # Exception is raised with the leader's arguments
+        with self.assertRaises(KeyError) as context:
+            self.loop.run_until_complete(follower.get_value('missing'))
+        self.assertEqual(context.exception.args, ('missing',))
+
+
+class TestAutoTune(SimulatedClusterTestCase):
+    def setUp(self):
+        super().setUp()
+        raftos.configure({'auto_tune_timeouts': True})
+
+    def tearDown(self):
+        raftos.configure({'auto_tune_timeouts': False})
+        super().tearDown()
+
+    def test_fast_network(self):
+        self.loop.run_for(10)
+        leader = self.leaders[0]
+
+        stats = leader.state.state.rtt.stats()
+        self.assertEqual(len(stats), self.SIZE - 1)
+        for follower in stats.values():
+            self.assertLess(follower['p99'], 0.05)
+
+        # Tuned down to the lower bound and advertised to followers
+        for node in self.nodes:
+            self.assertEqual(node.state.heartbeat_interval, 0.05)
+
+        # Election timeouts are 0.25 — 0.75s now (1.5 — 4.5s with the defaults)
+        self.network.isolate((leader.host, leader.port))
+        self.loop.run_for(5)
+        self.assertEqual(len([node for node in self.leaders if node is not leader]), 1)
+
+
+class TestHeartbeats(SimulatedClusterTestCase):
+    def setUp(self):
+        super().setUp()
+        raftos.configure({'idle_heartbeat_interval': 3, 'idle_timeout': 5})
+
+    def tearDown(self):
+        raftos.configure({'idle_heartbeat_interval': None, 'idle_timeout': 10})
+        super().tearDown()
+
+    def test_suppressed_while_replicating(self):
+        self.loop.run_for(10)
+        leader = self.leaders[0].state.state
+
+        # Followers got AppendEntries just now, the next heartbeat round sends nothing
+        self.execute({'key': 'value'})
+        sent = self.network.stats['sent']
+        leader.heartbeat()
+        self.loop.run_for(0)
+        self.assertEqual(self.network.stats['sent'], sent)
+
+        # Responses to replication keep the leader from stepping down
+        self.loop.run_for(3)
+        self.assertIs(self.leaders[0].state.state, leader)
+
+    def test_idle_backoff(self):
+        self.loop.run_for(20)
+        leader = self.leaders[0].state.state
+
+        # Idle interval is advertised to followers, election timeouts follow it
+        self.assertEqual(leader.heartbeat_interval(), 3)
+        for node in self.nodes:
+            if node.state.state is not leader:
+                self.assertEqual(node.state.heartbeat_interval, 3)
+
+        sent = self.network.stats['sent']
+        self.loop.run_for(30)
+        self.assertLess(self.network.stats['sent'] - sent, 2 * 2 * 30 / 3 + 10)
+        self.assertIs(self.leaders[0].state.state, leader)
+
+        # The first command brings back the configured interval
+        self.execute({'key': 'value'})
+        self.loop.run_for(1)
+        for node in self.nodes:
+            self.assertEqual(node.state.heartbeat_interval, raftos.config.heartbeat_interval)
+
+
+class TestWitness(SimulatedClusterTestCase):
+    WITNESSES = 1
+
+    @property
+    def witness(self):
+        return self.nodes[-1]
+
+    def test_metadata_only(self):
+        self.loop.run_for(10)
+        self.assertIsNot(self.leaders[0], self.witness)
+
+        self.execute({'key': 'value'})
+        self.loop.run_for(1)
+
+        log = self.witness.state.log
+        self.assertEqual(log.last_log_index, self.leaders[0].state.log.last_log_index)
+        self.assertEqual(log.commit_index, log.last_log_index)
+        self.assertEqual([log[index]['command'] for index in range(1, len(log) + 1)], [None] * len(log))
+        self.assertIsNone(self.witness.state.state_machine)
+        self.assertIsNone(self.witness.state.read_cache)
+
+        # The witness was registered last
+        with self.assertRaises(RuntimeError):
+            raftos.State.local_state_machine()
+
+    def test_full_replica_down(self):
+        self.loop.run_for(10)
+        leader = self.leaders[0]
+        replica = next(node for node in self.nodes if node is not leader and node is not self.witness)
+
+        # Leader & witness are the majority
+        self.network.isolate((replica.host, replica.port))
+        self.execute({'key': 'value'})
+        self.assertEqual(leader.state.state_machine['key'], 'value')
+
+        # Witness votes for the full replica once it's back, but never leads itself
+        self.network.heal()
+        self.loop.run_for(10)
+        self.network.isolate((leader.host, leader.port))
+        self.loop.run_for(20)
+        self.assertEqual(self.leaders, [replica])
+        self.assertEqual(replica.state.state_machine['key'], 'value')
+
+    def test_slow_replica(self):
+        self.loop.run_for(10)
+        leader = self.leaders[0]
+        replica = next(node for node in self.nodes if node is not leader and node is not self.witness)
+        replica_id, witness_id = (
+            leader.state.get_sender_id((node.host, node.port)) for node in (replica, self.witness)
+        )
+
+        # The witness has stored an entry, the replica answers heartbeats but hasn't stored it yet
+        state = leader.state.state
+        state.log.write(leader.state.storage.term, {'key': 'value'})
+        state.log.match_index[witness_id] = state.log.last_log_index
+        state.last_contact[replica_id] = self.loop.time()
+
+        state.update_commit_index()
+        self.assertLess(state.log.commit_index, state.log.last_log_index)
+
+        # The replica hasn't responded for the step down interval: leader & witness are the majority
+        state.last_contact[replica_id] -= leader.state.step_down_interval()
+        state.update_commit_index()
+        self.assertEqual(state.log.commit_index, state.log.last_log_index)
+
+
+if __name__ == '__main__':
+    unittest.main()
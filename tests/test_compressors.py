@@ -0,0 +1,46 @@
+import unittest
+
+import raftos
+from raftos.compressors import DummyCompressor, LZ4Compressor, ZlibCompressor, ZstdCompressor
+
+
+class TestCompressors(unittest.TestCase):
+    def setUp(self):
+        raftos.configure({'compression_threshold': 100})
+
+        self.compressors = [DummyCompressor(raftos.config), ZlibCompressor(raftos.config)]
+        for optional in (LZ4Compressor, ZstdCompressor):
+            try:
+                self.compressors.append(optional(raftos.config))
+            except ImportError:
+                pass
+
+    def test_pack_unpack(self):
+        for compressor in self.compressors:
+            for data in (b'', b'heartbeat', b'x' * 99, b'value' * 1000, bytes(range(256)) * 10):
+                self.assertEqual(compressor.unpack(compressor.pack(data)), data)
+
+    def test_threshold(self):
+        for compressor in self.compressors:
+            self.assertEqual(compressor.pack(b'x' * 99), b'\x00' + b'x' * 99)
+
+            packed = compressor.pack(b'x' * 10000)
+            if compressor.CODE:
+                self.assertLess(len(packed), 1000)
+
+    def test_unpack_other_codec(self):
+        packed = ZlibCompressor(raftos.config).pack(b'value' * 1000)
+        for compressor in self.compressors:
+            self.assertEqual(compressor.unpack(packed), b'value' * 1000)
+
+    def test_unpack_stored(self):
+        for compressor in self.compressors:
+            self.assertEqual(compressor.unpack_stored(compressor.pack(b'value' * 1000)), b'value' * 1000)
+
+            # Written without the codec byte: msgpack map / JSON object
+            for legacy in (b'\x81\xa3key\xa5value', b'{"key": "value"}'):
+                self.assertEqual(compressor.unpack_stored(legacy), legacy)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import subprocess
+import sys
+import unittest
+
+import raftos
+from raftos.cryptors import Cryptor, crypto_enabled
+
+
+@unittest.skipUnless(crypto_enabled, 'cryptography is not installed')
+class TestCryptor(unittest.TestCase):
+    def setUp(self):
+        raftos.configure({'secret_key': b'raftos test secret key', 'salt': b'raftos test salt'})
+
+    def tearDown(self):
+        raftos.configure({'secret_key': b'raftos sample secret key', 'salt': b'raftos sample salt'})
+
+    def test_encrypt_decrypt(self):
+        cryptor = Cryptor(raftos.config)
+        self.assertEqual(cryptor.decrypt(cryptor.encrypt(b'data')), b'data')
+
+    def test_keys_cached(self):
+        first, second = Cryptor(raftos.config), Cryptor(raftos.config)
+        self.assertIs(first.fernet, second.fernet)
+
+        fernet, encrypted = first.fernet, first.encrypt(b'data')
+        raftos.configure({'secret_key': b'raftos other secret key'})
+        self.assertIsNot(first.fernet, fernet)
+        with self.assertRaises(Exception):
+            first.decrypt(encrypted)
+
+
+class TestImport(unittest.TestCase):
+    def test_lazy_dependencies(self):
+        modules = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys, raftos; print(" ".join(sorted(sys.modules)))'
+        ]).decode().split()
+
+        for module in ('cryptography', 'msgpack', 'ujson', 'lz4', 'zstandard'):
+            self.assertNotIn(module, modules)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+from raftos import messages
+from raftos.serializers import MessagePackSerializer
+
+
+class TestMessages(unittest.TestCase):
+    sender = ('127.0.0.1', 8000)
+
+    heartbeat = {
+        'type': 'append_entries',
+        'term': 7,
+        'leader_id': '127.0.0.1:8001',
+        'commit_index': 100,
+        'request_id': 42,
+        'prev_log_index': 100,
+        'prev_log_term': 7,
+        'entries': [],
+        'heartbeat_interval': 0.3
+    }
+
+    def _round_trip(self, data):
+        packed = MessagePackSerializer.pack(messages.encode(data))
+        return messages.decode(MessagePackSerializer.unpack(packed), self.sender)
+
+    def test_round_trip(self):
+        append_entries = dict(self.heartbeat, entries=[{'term': 7, 'command': {'key': 'value'}}])
+
+        for data in (self.heartbeat, append_entries):
+            self.assertEqual(self._round_trip(data), dict(data, sender=self.sender))
+
+    def test_missing_fields(self):
+        response = {'type': 'request_vote_response', 'term': 3, 'vote_granted': True}
+        decoded = self._round_trip(response)
+
+        self.assertTrue(decoded['vote_granted'])
+        self.assertIsNone(decoded['request_id'])
+
+        # Message from a node which doesn't know about the last field yet
+        message = messages.encode({'type': 'append_entries_response', 'term': 1, 'success': False})
+        decoded = messages.decode(message[:-1], self.sender)
+        self.assertIsNone(decoded['request_id'])
+
+    def test_compact(self):
+        compact = MessagePackSerializer.pack(messages.encode(self.heartbeat))
+        verbose = MessagePackSerializer.pack(self.heartbeat)
+        self.assertLess(len(compact), len(verbose) / 2)
+
+    def test_version(self):
+        message = messages.encode(self.heartbeat)
+        message[0] = messages.VERSION + 1
+
+        with self.assertRaises(ValueError):
+            messages.decode(message, self.sender)
+
+    def test_all_types(self):
+        for code, (message_type, fields) in messages.SCHEMA.items():
+            data = dict({field: None for field in fields}, type=message_type)
+            if 'entries' in fields:
+                data['entries'] = []
+            self.assertEqual(messages.encode(data)[1], code)
+            self.assertEqual(self._round_trip(data), dict(data, sender=self.sender))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import asyncio
+import unittest
+
+import raftos
+from raftos.cryptors import DummyCryptor
+from raftos.network import OutboundQueue, ReassemblyBuffer, UDPProtocol
+from raftos.serializers import MessagePackSerializer
+from raftos.server import Node
+from raftos.simulation import SimulatedEventLoop, SimulatedNetwork
+
+
+class TestOutboundQueue(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.queue = OutboundQueue(self.loop, maxsize=3)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def _get_all(self):
+        async def get_all():
+            items = []
+            for _ in range(self.queue.qsize()):
+                items.append(await self.queue.get())
+            return items
+        return self.loop.run_until_complete(get_all())
+
+    def test_control_first(self):
+        async def put():
+            await self.queue.put('entries 1', OutboundQueue.DATA)
+            await self.queue.put('heartbeat', OutboundQueue.CONTROL)
+            await self.queue.put('entries 2', OutboundQueue.DATA)
+            await self.queue.put('vote', OutboundQueue.CONTROL)
+
+        self.loop.run_until_complete(put())
+        self.assertEqual(self.queue.depth, {'control': 2, 'data': 2, 'dropped': 0})
+        self.assertEqual(self._get_all(), ['heartbeat', 'vote', 'entries 1', 'entries 2'])
+
+    def test_control_superseded(self):
+        async def put():
+            for message in ('heartbeat a', 'vote b', 'heartbeat b', 'heartbeat a 2', 'vote c'):
+                await self.queue.put(message, OutboundQueue.CONTROL, key=tuple(message.split()[:2]))
+
+        self.loop.run_until_complete(put())
+
+        # The older heartbeat to a is superseded, nothing is queued to c yet to make room for the vote
+        self.assertEqual(self.queue.depth['dropped'], 2)
+        self.assertEqual(self._get_all(), ['vote b', 'heartbeat b', 'heartbeat a 2'])
+
+    def test_data_waits(self):
+        async def run():
+            for i in range(3):
+                await self.queue.put(i, OutboundQueue.DATA)
+
+            blocked = self.loop.create_task(self.queue.put(3, OutboundQueue.DATA))
+            await asyncio.sleep(0)
+            self.assertFalse(blocked.done())
+
+            first = await self.queue.get()
+            await blocked
+            return first
+
+        self.assertEqual(self.loop.run_until_complete(run()), 0)
+        self.assertEqual(self._get_all(), [1, 2, 3])
+
+    def test_get_waits(self):
+        async def run():
+            getter = self.loop.create_task(self.queue.get())
+            await asyncio.sleep(0)
+            await self.queue.put('heartbeat')
+            return await getter
+
+        self.assertEqual(self.loop.run_until_complete(run()), 'heartbeat')
+
+    def test_priorities(self):
+        self.assertEqual(Node.get_priority({'type': 'append_entries', 'entries': []}), OutboundQueue.CONTROL)
+        self.assertEqual(Node.get_priority({'type': 'append_entries', 'entries': [{}]}), OutboundQueue.DATA)
+        self.assertEqual(Node.get_priority({'type': 'request_vote_response'}), OutboundQueue.CONTROL)
+        self.assertEqual(Node.get_priority({'type': 'forward_request_response'}), OutboundQueue.DATA)
+
+
+class TestReassemblyBuffer(unittest.TestCase):
+    def setUp(self):
+        self.loop = SimulatedEventLoop()
+        self.buffer = ReassemblyBuffer(self.loop, maxsize=10, timeout=1)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_reassemble(self):
+        self.assertIsNone(self.buffer.add('a', 2, 3, b'ef'))
+        self.assertIsNone(self.buffer.add('a', 0, 3, b'ab'))
+        self.assertEqual(self.buffer.missing('a'), [1])
+
+        self.assertEqual(self.buffer.add('a', 1, 3, b'cd'), b'abcdef')
+        self.assertEqual(self.buffer.size, 0)
+
+        # Late duplicate of a completed message
+        self.assertIsNone(self.buffer.add('a', 1, 3, b'cd'))
+        self.assertNotIn('a', self.buffer)
+
+    def test_bounded(self):
+        self.buffer.add('a', 0, 2, b'12345')
+        self.buffer.add('b', 0, 2, b'12345')
+        self.buffer.add('c', 0, 2, b'12345')
+
+        self.assertNotIn('a', self.buffer)
+        self.assertIn('c', self.buffer)
+        self.assertEqual(self.buffer.size, 10)
+
+    def test_expired(self):
+        self.buffer.add('a', 0, 2, b'ab')
+        self.loop.run_for(2)
+        self.assertTrue(self.buffer.is_expired('a'))
+
+
+class TestFragmentation(unittest.TestCase):
+    def setUp(self):
+        raftos.configure({
+            'serializer': MessagePackSerializer,
+            'cryptor': DummyCryptor,
+            'max_datagram_size': 100
+        })
+
+        self.loop = SimulatedEventLoop()
+        self.network = SimulatedNetwork(self.loop, seed=1, drop_rate=0.3, reorder_rate=0.3)
+        self.received = []
+
+        self.sender = self._endpoint(('127.0.0.1', 8000))
+        self.receiver = self._endpoint(('127.0.0.1', 8001))
+
+    def tearDown(self):
+        raftos.configure({'max_datagram_size': 1400})
+        self.loop.close()
+
+    def _endpoint(self, address):
+        protocol = UDPProtocol(
+            queue=OutboundQueue(self.loop),
+            request_handler=self.received.append,
+            loop=self.loop
+        )
+        self.loop.run_until_complete(self.network.create_datagram_endpoint(protocol, local_addr=address))
+        return protocol
+
+    def test_lossy_network(self):
+        entries = [{'term': 1, 'command': {'key:{}'.format(i): 'value' * 10}} for i in range(50)]
+        data = {'type': 'append_entries', 'term': 1, 'entries': entries}
+
+        self.loop.run_until_complete(self.sender.queue.put({'data': data, 'destination': ('127.0.0.1', 8001)}))
+        self.loop.run_for(3)
+
+        self.assertEqual(len(self.received), 1)
+        self.assertEqual(self.received[0]['entries'], entries)
+        self.assertEqual(self.receiver.reassembly.size, 0)
+        self.assertGreater(len(self.sender.sent.messages[self.sender.message_id][1]), 1)
+        self.assertGreater(self.network.stats['dropped'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
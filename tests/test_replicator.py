@@ -0,0 +1,137 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from raftos.cache import ReadCache
+from raftos.exceptions import PreconditionFailedException
+from raftos.replicator import Replicated, ReplicatedDict
+from raftos.state import State
+
+
+class TestReplicated(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+        # Fake State Machine on the leader: {name: [value, version]}
+        self.data = {}
+        self.index = 0
+        self.reads = 0
+
+        patchers = [
+            mock.patch.object(State, 'get_versioned_value', self.get_versioned_value),
+            mock.patch.object(State, 'compare_and_set', self.compare_and_set)
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    async def get_versioned_value(self, name):
+        self.reads += 1
+        value, version = self.data[name]
+        return [value, version]
+
+    async def compare_and_set(self, name, version, value):
+        self.index += 1
+        if self.data.get(name, [None, 0])[1] != version:
+            return False
+
+        self.data[name] = [value, self.index]
+        return True
+
+    def test_compare_and_set(self):
+        replicated = Replicated(name='value')
+
+        self.assertTrue(self.loop.run_until_complete(replicated.compare_and_set(0, 'first')))
+        self.assertFalse(self.loop.run_until_complete(replicated.compare_and_set(0, 'second')))
+        self.assertEqual(self.data['value'], ['first', 1])
+
+    def test_modify_retries_on_conflict(self):
+        replicated = ReplicatedDict(name='data')
+        self.data['data'] = [{'a': 1}, 1]
+
+        calls = []
+
+        def change(data):
+            calls.append(dict(data))
+            if len(calls) == 1:
+                # Somebody else changes the value between our read & write
+                self.data['data'] = [{'a': 1, 'b': 2}, 5]
+            data['c'] = 3
+            return 'result'
+
+        self.assertEqual(self.loop.run_until_complete(replicated.modify(change)), 'result')
+        self.assertEqual(calls, [{'a': 1}, {'a': 1, 'b': 2}])
+        self.assertEqual(self.data['data'][0], {'a': 1, 'b': 2, 'c': 3})
+
+    def test_modify_gives_up(self):
+        replicated = ReplicatedDict(name='data')
+        replicated.MODIFY_BACKOFF = 0
+        self.data['data'] = [{}, 1]
+
+        def change(data):
+            # Somebody else changes the value every time
+            self.data['data'][1] += 1
+
+        with self.assertRaises(PreconditionFailedException):
+            self.loop.run_until_complete(replicated.modify(change))
+
+        self.assertEqual(self.reads, Replicated.MODIFY_ATTEMPTS)
+
+    def test_default_is_not_shared(self):
+        first, second = ReplicatedDict(name='first'), ReplicatedDict(name='second')
+        self.loop.run_until_complete(first.modify(lambda data: data.update({'a': 1})))
+
+        self.assertEqual(self.data['first'][0], {'a': 1})
+        self.assertEqual(ReplicatedDict.DEFAULT_VALUE, {})
+        self.assertEqual(second.value, {})
+
+    def test_get_cached(self):
+        read_cache = ReadCache()
+        with mock.patch.object(State, 'instance', mock.Mock(read_cache=read_cache)):
+            replicated = Replicated(name='value')
+            self.data['value'] = ['first', 1]
+
+            for _ in range(3):
+                self.assertEqual(self.loop.run_until_complete(replicated.get()), 'first')
+            self.assertEqual(self.reads, 1)
+
+            # Change applied by the local State Machine
+            read_cache(2, {'value': 'second'}, [])
+            self.assertEqual(self.loop.run_until_complete(replicated.get()), 'second')
+            self.assertEqual(self.reads, 1)
+
+    def test_get_cached_during_read(self):
+        read_cache = ReadCache()
+        get_versioned_value = self.get_versioned_value
+
+        # Local State Machine applies a newer change while the leader's answer is on its way
+        async def slow_read(name):
+            result = await get_versioned_value(name)
+            read_cache(2, {'value': 'second'}, [])
+            return result
+
+        with mock.patch.object(State, 'instance', mock.Mock(read_cache=read_cache)):
+            with mock.patch.object(State, 'get_versioned_value', slow_read):
+                replicated = Replicated(name='value')
+                self.data['value'] = ['first', 1]
+
+                self.assertEqual(self.loop.run_until_complete(replicated.get()), 'first')
+                self.assertEqual(read_cache.get('value'), ('second', 2))
+
+    def test_get_witness(self):
+        # Witnesses have no read cache: every read goes to the leader
+        with mock.patch.object(State, 'instance', mock.Mock(read_cache=None)):
+            replicated = Replicated(name='value')
+            self.data['value'] = ['first', 1]
+            self.assertEqual(self.loop.run_until_complete(replicated.get()), 'first')
+
+            self.data['value'] = ['second', 2]
+            self.assertEqual(self.loop.run_until_complete(replicated.get()), 'second')
+            self.assertEqual(self.reads, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
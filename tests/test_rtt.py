@@ -0,0 +1,74 @@
+import unittest
+
+from raftos.rtt import RTTMonitor
+from raftos.simulation import SimulatedEventLoop
+
+
+class TestRTTMonitor(unittest.TestCase):
+    def setUp(self):
+        self.loop = SimulatedEventLoop()
+        self.rtt = RTTMonitor(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def _round_trip(self, follower, request_id, rtt):
+        self.rtt.sent(follower, request_id)
+        self.loop.advance(rtt)
+        self.rtt.received(follower, request_id)
+
+    def test_samples(self):
+        for request_id in range(1, 101):
+            self._round_trip('a', request_id, request_id / 1000)
+
+        self._round_trip('b', 1, 0.5)
+
+        self.assertAlmostEqual(self.rtt.percentile(50, 'a'), 0.051)
+        self.assertAlmostEqual(self.rtt.percentile(99, 'a'), 0.1)
+        self.assertAlmostEqual(self.rtt.percentile(100), 0.5)
+
+        stats = self.rtt.stats()
+        self.assertEqual(stats['a']['samples'], 100)
+        self.assertAlmostEqual(stats['b']['last'], 0.5)
+
+    def test_first_request_of_round(self):
+        self.rtt.sent('a', 1)
+        self.loop.advance(0.1)
+        self.rtt.sent('a', 1)
+        self.loop.advance(0.1)
+        self.rtt.received('a', 1)
+
+        # Duplicate & unknown responses
+        self.rtt.received('a', 1)
+        self.rtt.received('a', 2)
+
+        self.assertEqual(list(self.rtt.samples['a']), [self.rtt.percentile(50)])
+        self.assertAlmostEqual(self.rtt.percentile(50), 0.2)
+
+    def test_in_flight(self):
+        self.rtt.sent('a', 1)
+        self.loop.advance(1)
+        self.rtt.sent('a', 2)
+        self.rtt.sent('a', 3)
+        self.rtt.received('a', 3)
+
+        self.assertEqual(self.rtt.in_flight('a', 2), 2)
+        self.assertEqual(self.rtt.in_flight('a', 0.5), 1)
+        self.assertEqual(self.rtt.in_flight('b', 2), 0)
+
+    def test_heartbeat_interval(self):
+        self.assertIsNone(self.rtt.heartbeat_interval(99, (0.05, 1), min_samples=1))
+
+        self._round_trip('a', 1, 0.001)
+        self.assertEqual(self.rtt.heartbeat_interval(99, (0.05, 1), min_samples=1), 0.05)
+        self.assertIsNone(self.rtt.heartbeat_interval(99, (0.05, 1), min_samples=2))
+
+        self._round_trip('a', 2, 0.1)
+        self.assertAlmostEqual(self.rtt.heartbeat_interval(99, (0.05, 1), min_samples=2), 0.4)
+
+        self._round_trip('a', 3, 1)
+        self.assertEqual(self.rtt.heartbeat_interval(99, (0.05, 1), min_samples=2), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import asyncio
+import time
+import unittest
+
+from raftos.simulation import SimulatedEventLoop, SimulatedNetwork
+from raftos.timer import Timer
+
+
+class Receiver(asyncio.DatagramProtocol):
+    def __init__(self, loop):
+        self.loop = loop
+        self.received = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, sender):
+        self.received.append((self.loop.time(), data, sender))
+
+
+class TestSimulatedEventLoop(unittest.TestCase):
+    def setUp(self):
+        self.loop = SimulatedEventLoop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def test_virtual_time(self):
+        started = time.monotonic()
+        self.loop.run_for(3600)
+
+        self.assertEqual(self.loop.time(), 3600)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_timer(self):
+        calls = []
+        timer = Timer(0.3, lambda: calls.append(self.loop.time()))
+        timer.start()
+        self.loop.run_for(3.1)
+        timer.stop()
+
+        self.assertEqual(len(calls), 10)
+        self.assertAlmostEqual(calls[-1], 3.0)
+
+    def test_timer_reset(self):
+        calls = []
+        timer = Timer(1, lambda: calls.append(self.loop.time()))
+        timer.start()
+
+        scheduled = []
+        call_at = self.loop.call_at
+        self.loop.call_at = lambda *args, **kwargs: scheduled.append(args) or call_at(*args, **kwargs)
+
+        for _ in range(50):
+            self.loop.run_for(0.1)
+            timer.reset()
+        self.loop.run_for(1.5)
+        timer.stop()
+
+        # Resets within the interval don't fire the timer and reuse loop handles
+        self.assertEqual(len(calls), 1)
+        self.assertAlmostEqual(calls[0], 6.0)
+        self.assertLess(len([args for args in scheduled if args[1] == timer._run]), 10)
+
+    def test_timer_reset_earlier(self):
+        intervals = [10, 1]
+        calls = []
+        timer = Timer(lambda: intervals.pop(0) if intervals else 10, lambda: calls.append(self.loop.time()))
+        timer.start()
+        timer.reset()
+        self.loop.run_for(2)
+        timer.stop()
+
+        self.assertEqual(calls, [1])
+
+    def test_timer_reset_stopped(self):
+        calls = []
+        timer = Timer(1, lambda: calls.append(self.loop.time()))
+        timer.start()
+        timer.stop()
+        timer.reset()
+        self.loop.run_for(2)
+
+        self.assertEqual(calls, [])
+
+
+class TestSimulatedNetwork(unittest.TestCase):
+    def setUp(self):
+        self.loop = SimulatedEventLoop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def _connect(self, network, *addresses):
+        receivers = []
+        for address in addresses:
+            receiver = Receiver(self.loop)
+            self.loop.run_until_complete(
+                network.create_datagram_endpoint(lambda: receiver, local_addr=address)
+            )
+            receivers.append(receiver)
+        return receivers
+
+    def _run(self, seed, drop_rate):
+        network = SimulatedNetwork(self.loop, seed=seed, drop_rate=drop_rate, reorder_rate=0.5)
+        a, b = ('127.0.0.1', 8000), ('127.0.0.1', 8001)
+        sender, receiver = self._connect(network, a, b)
+
+        for i in range(100):
+            sender.transport.sendto(str(i).encode(), b)
+        self.loop.run_for(1)
+
+        return [data for _, data, _ in receiver.received]
+
+    def test_delivery(self):
+        received = self._run(seed=1, drop_rate=0)
+        self.assertEqual(sorted(received), sorted(str(i).encode() for i in range(100)))
+
+    def test_seeded_drop_and_reorder(self):
+        first = self._run(seed=42, drop_rate=0.3)
+
+        self.assertLess(len(first), 100)
+        self.assertNotEqual(first, sorted(first, key=int))
+        self.assertEqual(first, self._run(seed=42, drop_rate=0.3))
+
+    def test_partition(self):
+        network = SimulatedNetwork(self.loop, seed=0)
+        a, b, c = ('127.0.0.1', 8000), ('127.0.0.1', 8001), ('127.0.0.1', 8002)
+        node_a, node_b, node_c = self._connect(network, a, b, c)
+
+        network.isolate(a)
+        node_a.transport.sendto(b'lost', b)
+        node_b.transport.sendto(b'delivered', c)
+        self.loop.run_for(1)
+
+        self.assertEqual(node_b.received, [])
+        self.assertEqual([data for _, data, _ in node_c.received], [b'delivered'])
+
+        network.heal()
+        node_a.transport.sendto(b'healed', b)
+        self.loop.run_for(1)
+        self.assertEqual([(data, sender) for _, data, sender in node_b.received], [(b'healed', a)])
+
+
+if __name__ == '__main__':
+    unittest.main()
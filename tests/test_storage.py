@@ -0,0 +1,573 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import raftos
+from raftos.backends import MemoryBackend, SQLiteBackend
+from raftos.serializers import MessagePackSerializer
+from raftos.session import ClientSession
+from raftos.storage import Log, Scan, StateMachine
+
+
+class TestLog(unittest.TestCase):
+    def setUp(self):
+        self.log_path = tempfile.mkdtemp()
+        raftos.configure({'log_path': self.log_path})
+
+    def tearDown(self):
+        shutil.rmtree(self.log_path)
+
+    def _log(self):
+        return Log('127.0.0.1:8000', serializer=MessagePackSerializer)
+
+    def test_write_read(self):
+        log = self._log()
+        for i in range(1, 21):
+            # 10 is a newline byte in msgpack, records must not depend on it
+            log.write(i // 5, {'key': i, 'value': '\n' * i})
+
+        restored = self._log()
+        self.assertEqual(len(restored), 20)
+        self.assertEqual(restored.last_log_term, 4)
+        self.assertEqual(len(restored.cache), 0)
+
+        for i in range(1, 21):
+            self.assertEqual(restored.term(i), i // 5)
+            self.assertEqual(restored[i], {'term': i // 5, 'command': {'key': i, 'value': '\n' * i}})
+
+        with self.assertRaises(IndexError):
+            restored[21]
+
+        with self.assertRaises(IndexError):
+            restored.term(0)
+
+        self.assertEqual(restored.offset(1), len(Log.FILE_HEADER))
+        self.assertEqual(restored.offset(21), os.path.getsize(restored.filename))
+
+    def test_cache_is_bounded(self):
+        log = self._log()
+        log.CACHE_SIZE = 10
+        for i in range(100):
+            log.write(1, {'key': i})
+
+        self.assertEqual(len(log.cache), 10)
+        self.assertEqual(log[1]['command'], {'key': 0})
+        self.assertEqual(len(log.cache), 10)
+        self.assertIn(1, log.cache)
+
+    def test_erase_from(self):
+        log = self._log()
+        for i in range(10):
+            log.write(1, {'key': i})
+
+        log.erase_from(6)
+        log.write(2, {'key': 'new'})
+
+        restored = self._log()
+        self.assertEqual(len(restored), 6)
+        self.assertEqual(restored[5]['command'], {'key': 4})
+        self.assertEqual(restored[6], {'term': 2, 'command': {'key': 'new'}})
+
+    def test_incomplete_record(self):
+        log = self._log()
+        for i in range(3):
+            log.write(1, {'key': i})
+
+        with open(log.filename, 'ab') as f:
+            f.write(Log.HEADER.pack(1, 100) + b'partial')
+
+        restored = self._log()
+        self.assertEqual(len(restored), 3)
+        self.assertEqual(os.path.getsize(restored.filename), restored.size)
+
+        restored.write(2, {'key': 3})
+        self.assertEqual(self._log()[4]['command'], {'key': 3})
+
+    def test_legacy_log(self):
+        filename = os.path.join(self.log_path, '127.0.0.1_8000.log')
+        entries = [{'term': i, 'command': {'key': i, 'value': '\n'}} for i in range(1, 21)]
+        with open(filename, 'wb') as f:
+            for entry in entries:
+                f.write(MessagePackSerializer.pack(entry) + b'\n')
+
+        log = self._log()
+        self.assertEqual([log[i] for i in range(1, 21)], entries)
+
+        restored = self._log()
+        self.assertEqual(len(restored), 20)
+        self.assertEqual(restored[10], entries[9])
+
+    def test_unknown_format(self):
+        filename = os.path.join(self.log_path, '127.0.0.1_8000.log')
+        for content in (b'not a log\n', Log.MAGIC + bytes([Log.VERSION + 1])):
+            with open(filename, 'wb') as f:
+                f.write(content)
+
+            with self.assertRaises(ValueError):
+                self._log()
+
+            # Left as it was
+            with open(filename, 'rb') as f:
+                self.assertEqual(f.read(), content)
+
+    def test_index(self):
+        log = self._log()
+        for i in range(10):
+            log.write(i, {'key': i})
+
+        with open(log.index_filename, 'rb') as f:
+            self.assertEqual(len(f.read()), 10 * Log.INDEX_RECORD.size)
+
+        # Restart must not scan the log when index is complete
+        original = Log._record_end
+        calls = []
+        Log._record_end = lambda *args: calls.append(args) or original(*args)
+        try:
+            restored = self._log()
+        finally:
+            Log._record_end = original
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(list(restored.terms), list(range(10)))
+        self.assertEqual(list(restored.offsets), list(log.offsets))
+
+    def test_index_recovery(self):
+        log = self._log()
+        for i in range(10):
+            log.write(1, {'key': i})
+
+        # Index lost its tail
+        os.truncate(log.index_filename, 4 * Log.INDEX_RECORD.size)
+        restored = self._log()
+        self.assertEqual(len(restored), 10)
+        self.assertEqual(restored[10]['command'], {'key': 9})
+
+        # Index points beyond the log
+        os.truncate(log.filename, log.offsets[7])
+        restored = self._log()
+        self.assertEqual(len(restored), 7)
+        with open(log.index_filename, 'rb') as f:
+            self.assertEqual(len(f.read()), 7 * Log.INDEX_RECORD.size)
+
+        # Index is missing completely
+        os.remove(log.index_filename)
+        self.assertEqual(list(self._log().offsets), list(restored.offsets))
+
+
+class TestStateMachine(unittest.TestCase):
+    backend = MemoryBackend
+
+    def setUp(self):
+        self.log_path = tempfile.mkdtemp()
+        raftos.configure({
+            'log_path': self.log_path,
+            'serializer': MessagePackSerializer,
+            'state_machine_backend': self.backend
+        })
+
+    def tearDown(self):
+        raftos.configure({'state_machine_backend': MemoryBackend})
+        shutil.rmtree(self.log_path)
+
+    def test_checkpoint(self):
+        state_machine = StateMachine('127.0.0.1:8000')
+        self.assertEqual(state_machine.last_applied, 0)
+
+        state_machine.apply({'a': 1}, 1)
+        state_machine.apply({'b': 2, 'a': 3}, 2)
+
+        restored = StateMachine('127.0.0.1:8000')
+        self.assertEqual(restored.last_applied, 2)
+        self.assertEqual(restored['a'], 3)
+        self.assertEqual(restored['b'], 2)
+        self.assertFalse(restored.exists('data'))
+
+    def test_legacy_file(self):
+        if self.backend is not MemoryBackend:
+            self.skipTest('Only MemoryBackend reads files of earlier versions')
+
+        filename = os.path.join(self.log_path, '127.0.0.1_8000.state_machine')
+
+        # Data only, not compressed
+        with open(filename, 'wb') as f:
+            f.write(MessagePackSerializer.pack({'a': 1}))
+
+        state_machine = StateMachine('127.0.0.1:8000')
+        self.assertEqual((state_machine['a'], state_machine.last_applied), (1, 0))
+
+        # Checkpoint inside meta
+        with open(filename, 'wb') as f:
+            f.write(raftos.config.compressor.pack(MessagePackSerializer.pack({
+                'data': {'a': 2}, 'meta': {'last_applied': 5, 'versions': {'a': 5}, 'expiry': {'a': 110}}
+            })))
+
+        state_machine = StateMachine('127.0.0.1:8000')
+        self.assertEqual((state_machine['a'], state_machine.last_applied, state_machine.version('a')), (2, 5, 5))
+        self.assertEqual(state_machine.next_expiry(), 110)
+
+        # Staged bulk loads inside meta
+        with open(filename, 'wb') as f:
+            f.write(raftos.config.compressor.pack(MessagePackSerializer.pack({
+                'data': {'a': 2}, 'meta': {'last_applied': 5, 'staged': {'x': {'b': 3}}}
+            })))
+
+        state_machine = StateMachine('127.0.0.1:8000')
+        self.assertEqual(state_machine.loads, {'x': 1})
+        state_machine.apply(['load_commit', {'load_id': 'x', 'replace': False}], 6)
+        self.assertEqual(StateMachine('127.0.0.1:8000')['b'], 3)
+
+    def test_versions(self):
+        state_machine = StateMachine('127.0.0.1:8000')
+        state_machine.apply({'a': 1}, 1)
+        state_machine.apply({'b': 2}, 2)
+        state_machine.apply({'a': 3}, 3)
+
+        self.assertEqual(state_machine.version('a'), 3)
+        self.assertEqual(state_machine.version('b'), 2)
+        self.assertEqual(state_machine.version('c'), 0)
+        self.assertEqual(StateMachine('127.0.0.1:8000').version('a'), 3)
+
+    def test_transaction(self):
+        state_machine = StateMachine('127.0.0.1:8000')
+        state_machine.apply({'a': 1, 'b': 2}, 1)
+
+        result = state_machine.apply(['transaction', {
+            'updates': {'a': 10, 'c': 30},
+            'deletes': ['b'],
+            'conditions': {'a': {'version': 1, 'value': 1}, 'c': {'version': 0}}
+        }], 2)
+        self.assertEqual(result, {'success': True})
+        self.assertEqual((state_machine['a'], state_machine['c']), (10, 30))
+        self.assertFalse(state_machine.exists('b'))
+        self.assertEqual(state_machine.version('b'), 0)
+        self.assertEqual(state_machine.version('c'), 2)
+
+        for conditions in ({'a': {'version': 1}}, {'a': {'value': 1}}, {'b': {'value': None}}):
+            result = state_machine.apply(['transaction', {
+                'updates': {'a': 100, 'd': 40},
+                'deletes': ['c'],
+                'conditions': conditions
+            }], 3)
+            self.assertEqual(result, {'success': False, 'failed': list(conditions)[0]})
+
+        restored = StateMachine('127.0.0.1:8000')
+        self.assertEqual(restored.last_applied, 3)
+        self.assertEqual((restored['a'], restored['c']), (10, 30))
+        self.assertFalse(restored.exists('d'))
+
+    def test_compare_and_set(self):
+        state_machine = StateMachine('127.0.0.1:8000')
+
+        self.assertTrue(state_machine.apply(['compare_and_set', {'name': 'a', 'version': 0, 'value': 1}], 1))
+        self.assertFalse(state_machine.apply(['compare_and_set', {'name': 'a', 'version': 0, 'value': 2}], 2))
+        self.assertTrue(state_machine.apply(['compare_and_set', {'name': 'a', 'version': 1, 'value': 3}], 3))
+
+        self.assertEqual(state_machine['a'], 3)
+        self.assertEqual(state_machine.version('a'), 3)
+
+    def test_operations(self):
+        state_machine = StateMachine('127.0.0.1:8000')
+        commands = [
+            (['increment', {'name': 'counter', 'delta': 5}], 5),
+            (['increment', {'name': 'counter', 'delta': -2}], 3),
+            (['set_add', {'name': 'set', 'item': 'a'}], True),
+            (['set_add', {'name': 'set', 'item': 'a'}], False),
+            (['set_add', {'name': 'set', 'item': 'b'}], True),
+            (['set_remove', {'name': 'set', 'item': 'a'}], True),
+            (['set_remove', {'name': 'set', 'item': 'c'}], False),
+            (['queue_push', {'name': 'queue', 'items': [1, 2]}], 2),
+            (['queue_pop', {'name': 'queue'}], {'empty': False, 'item': 1}),
+            (['queue_pop', {'name': 'queue'}], {'empty': False, 'item': 2}),
+            (['queue_pop', {'name': 'queue'}], {'empty': True}),
+        ]
+
+        for index, (command, result) in enumerate(commands, 1):
+            self.assertEqual(state_machine.apply(command, index), result)
+
+        restored = StateMachine('127.0.0.1:8000')
+        self.assertEqual(restored.last_applied, len(commands))
+        self.assertEqual(restored['counter'], 3)
+        self.assertEqual(restored['set'], ['b'])
+        self.assertEqual(restored['queue'], [])
+        self.assertEqual(restored.version('set'), 6)
+
+    def test_refused(self):
+        state_machine = StateMachine('127.0.0.1:8000')
+        state_machine.apply({'string': 'a', 'dict': {'a': 1}}, 1)
+
+        commands = [
+            ['increment', {'name': 'string', 'delta': 1}],
+            ['increment', {'name': 'counter', 'delta': 'a'}],
+            ['set_add', {'name': 'dict', 'item': 'b'}],
+            ['set_remove', {'name': 'string', 'item': 'a'}],
+            ['queue_push', {'name': 'dict', 'items': [1]}],
+            ['queue_pop', {'name': 'string'}],
+            ['unknown', {}],
+            'value'
+        ]
+
+        # Entries are applied anyway, values are left as they are
+        for index, command in enumerate(commands, 2):
+            result = state_machine.apply(command, index)
+            self.assertEqual(set(result), {'error', 'message'})
+            self.assertEqual(state_machine.last_applied, index)
+
+        restored = StateMachine('127.0.0.1:8000')
+        self.assertEqual(restored.last_applied, len(commands) + 1)
+        self.assertEqual((restored['string'], restored['dict'], restored.exists('counter')), ('a', {'a': 1}, False))
+
+        # Refused commands within sessions
+        session = ClientSession()
+        increment = ['increment', {'name': 'string', 'delta': 1}]
+        sequence = session.start_request()
+        result = restored.apply(session.wrap(sequence, increment), 20)
+        self.assertEqual(result['error'], 'TypeError')
+        self.assertEqual(restored.apply(session.wrap(sequence, increment), 21), result)
+
+    def test_sessions(self):
+        session = ClientSession()
+        state_machine = StateMachine('127.0.0.1:8000')
+
+        first = session.start_request()
+        second = session.start_request()
+        increment = ['increment', {'name': 'counter', 'delta': 1}]
+
+        self.assertEqual(state_machine.apply(session.wrap(first, increment), 1), {'result': 1})
+        self.assertEqual(state_machine.apply(session.wrap(second, increment), 2), {'result': 2})
+
+        # Retries return saved results, nothing is applied again (even after restart)
+        self.assertEqual(state_machine.apply(session.wrap(first, increment), 3), {'result': 1})
+        restored = StateMachine('127.0.0.1:8000')
+        self.assertEqual(restored.apply(session.wrap(second, increment), 4), {'result': 2})
+        self.assertEqual(restored['counter'], 2)
+
+        session.finish_request(first)
+        session.finish_request(second)
+        third = session.start_request()
+        self.assertEqual(restored.apply(session.wrap(third, increment), 5), {'result': 3})
+
+        # Acknowledged results are forgotten
+        self.assertEqual(list(restored.sessions[session.client_id]['results']), [str(third)])
+
+    def test_sessions_bounded(self):
+        state_machine = StateMachine('127.0.0.1:8000')
+        state_machine.MAX_SESSIONS = 3
+        state_machine.MAX_SESSION_RESULTS = 2
+
+        sessions = [ClientSession() for _ in range(5)]
+        for index, session in enumerate(sessions, 1):
+            for _ in range(3):
+                state_machine.apply(session.wrap(session.start_request(), {'key': index}), index)
+
+        self.assertEqual(set(state_machine.sessions), {session.client_id for session in sessions[2:]})
+        for session in state_machine.sessions.values():
+            self.assertEqual(sorted(session['results']), ['2', '3'])
+
+        # Only the remaining sessions are saved
+        self.assertEqual(set(StateMachine('127.0.0.1:8000').sessions), set(state_machine.sessions))
+
+        # Retry of an evicted client can't be recognized, it's not applied again
+        evicted = sessions[0]
+        evicted.finish_request(1)
+        evicted.finish_request(2)
+        result = state_machine.apply(evicted.wrap(evicted.sequence, {'key': 'retry'}), 6)
+        self.assertEqual(result['error'], 'SessionExpiredException')
+        self.assertEqual(state_machine['key'], 5)
+
+    def test_load(self):
+        state_machine = StateMachine('127.0.0.1:8000')
+        state_machine.apply({'a': 1, 'old': 0}, 1)
+
+        self.assertEqual(state_machine.apply(['load', {'load_id': 'x', 'items': [['a', 2], ['b', 3]]}], 2), 2)
+        self.assertEqual(state_machine['a'], 1)
+        self.assertFalse(state_machine.exists('b'))
+
+        # Staged chunks survive restart
+        restored = StateMachine('127.0.0.1:8000')
+        self.assertEqual(restored.apply(['load', {'load_id': 'x', 'items': [['b', 6], ['c', 4]]}], 3), 3)
+
+        # Listeners get the changes page by page
+        changes = []
+        restored.listeners.append(lambda index, updates, deletes: changes.append((index, updates, deletes)))
+        with mock.patch.object(restored.backend, 'PAGE_SIZE', 2, create=True):
+            self.assertEqual(restored.apply(['load_commit', {'load_id': 'x', 'replace': True}], 4), 3)
+
+        self.assertEqual({index for index, _, _ in changes}, {4})
+        self.assertEqual(
+            ({name: value for _, updates, _ in changes for name, value in updates.items()},
+             [name for _, _, deletes in changes for name in deletes]),
+            ({'a': 2, 'b': 6, 'c': 4}, ['old'])
+        )
+        if self.backend is SQLiteBackend:
+            self.assertEqual([len(updates) + len(deletes) for _, updates, deletes in changes], [2, 1, 1])
+
+        index, snapshot = restored.snapshot()
+        self.assertEqual((index, dict(snapshot.items())), (4, {'a': 2, 'b': 6, 'c': 4}))
+        self.assertEqual(restored.version('c'), 4)
+        self.assertEqual((restored.loads, restored.backend.staged('x')), ({}, {}))
+        self.assertEqual(StateMachine('127.0.0.1:8000').loads, {})
+
+        restored.apply(['load', {'load_id': 'y', 'items': [['d', 5]]}], 5)
+        restored.apply(['load_abort', {'load_id': 'y'}], 6)
+        self.assertFalse(restored.exists('d'))
+
+        restored = StateMachine('127.0.0.1:8000')
+        self.assertEqual((restored.loads, restored.backend.staged('y')), ({}, {}))
+
+    def test_scan(self):
+        state_machine = StateMachine('127.0.0.1:8000')
+        state_machine.apply({'user:{:03}'.format(i): i for i in range(250)}, 1)
+        state_machine.apply({'a': 'first', 'z': 'last'}, 2)
+
+        def scan(**kwargs):
+            async def collect():
+                items = []
+                async for item in state_machine.scan(**kwargs):
+                    items.append(item)
+                return items
+
+            loop = asyncio.new_event_loop()
+            try:
+                return loop.run_until_complete(collect())
+            finally:
+                loop.close()
+
+        users = scan(prefix='user:')
+        self.assertEqual(len(users), 250)
+        self.assertEqual(users[0], ('user:000', 0))
+        self.assertEqual([value for _, value in users], list(range(250)))
+
+        self.assertEqual(
+            scan(start='user:100', end='user:103'),
+            [('user:100', 100), ('user:101', 101), ('user:102', 102)]
+        )
+        self.assertEqual(len(scan(prefix='user:1', limit=Scan.BATCH_SIZE + 5)), 100)
+        self.assertEqual(len(scan(limit=Scan.BATCH_SIZE + 5)), Scan.BATCH_SIZE + 5)
+        self.assertEqual(scan(start='user:248'), [('user:248', 248), ('user:249', 249), ('z', 'last')])
+        self.assertEqual(scan(prefix='missing'), [])
+
+    def test_snapshot_is_consistent(self):
+        state_machine = StateMachine('127.0.0.1:8000')
+        state_machine.apply({'a': 1, 'b': 2}, 1)
+
+        index, snapshot = state_machine.snapshot()
+        state_machine.apply({'a': 10, 'c': 30}, 2)
+        state_machine.apply(['transaction', {'updates': {}, 'deletes': ['b'], 'conditions': {}}], 3)
+
+        self.assertEqual(index, 1)
+        self.assertEqual(len(snapshot), 2)
+        self.assertEqual(dict(snapshot.items()), {'a': 1, 'b': 2})
+
+    def test_ttl(self):
+        state_machine = StateMachine('127.0.0.1:8000')
+        state_machine.apply(['set_ttl', {'name': 'a', 'value': 1, 'ttl': 10, 'clock': 100}], 1)
+        state_machine.apply(['set_ttl', {'name': 'b', 'value': 2, 'ttl': 5, 'clock': 100}], 2)
+        state_machine.apply(['set_ttl', {'name': 'c', 'value': 3, 'ttl': 5, 'clock': 100}], 3)
+
+        # Changed name loses its TTL
+        state_machine.apply({'c': 30}, 4)
+        self.assertEqual(state_machine.next_expiry(), 105)
+
+        self.assertEqual(state_machine.apply(['expire', {'clock': 104}], 5), 0)
+        self.assertEqual(state_machine.apply(['expire', {'clock': 106}], 6), 1)
+        self.assertFalse(state_machine.exists('b'))
+        self.assertEqual(state_machine['c'], 30)
+
+        # Replicated clock never goes back
+        self.assertEqual(state_machine.apply(['expire', {'clock': 50}], 7), 0)
+        self.assertEqual(state_machine.clock, 106)
+
+        restored = StateMachine('127.0.0.1:8000')
+        self.assertEqual(restored.next_expiry(), 110)
+        self.assertEqual(restored.apply(['expire', {'clock': 110}], 8), 1)
+        self.assertFalse(restored.exists('a'))
+        self.assertIsNone(restored.next_expiry())
+
+    def test_records(self):
+        state_machine = StateMachine('127.0.0.1:8000')
+        state_machine.apply(['set_ttl', {'name': 'a', 'value': 1, 'ttl': 10, 'clock': 100}], 1)
+        state_machine.apply(['lock_acquire', {'name': 'lock', 'owner': 'a', 'ttl': 10, 'clock': 100, 'wait': False}], 2)
+
+        # TTLs & locks are kept apart from meta, only the changed ones are written
+        written = []
+        set_records = state_machine.backend.set_records
+
+        def record(table, updates, deletes):
+            written.append((table, updates, list(deletes)))
+            set_records(table, updates, deletes)
+
+        with mock.patch.object(state_machine.backend, 'set_records', record):
+            state_machine.apply({'b': 1}, 3)
+            state_machine.apply({'a': 2}, 4)
+
+        self.assertEqual(written, [('expiry', {}, ['a'])])
+        self.assertEqual(set(state_machine.backend.load()), {'last_applied', 'loads', 'clock'})
+
+        restored = StateMachine('127.0.0.1:8000')
+        self.assertEqual((restored.expiry, restored.locks['lock']['owner']), ({}, 'a'))
+
+        # Older versions kept them in meta (MemoryBackend files still do, see test_legacy_file)
+        if self.backend is SQLiteBackend:
+            lock = restored.locks['lock']
+            restored.backend.set_records('locks', {}, ['lock'])
+            restored.backend.commit({'last_applied': 4, 'expiry': {'b': 110}, 'locks': {'other': lock}})
+
+            restored = StateMachine('127.0.0.1:8000')
+            self.assertEqual((restored.expiry, list(restored.locks)), ({'b': 110}, ['other']))
+            restored.apply({'c': 1}, 5)
+            self.assertEqual(set(restored.backend.load()), {'last_applied', 'loads', 'clock'})
+            self.assertEqual(StateMachine('127.0.0.1:8000').next_expiry(), 110)
+
+    def test_locks(self):
+        state_machine = StateMachine('127.0.0.1:8000')
+        changes = []
+        state_machine.lock_listeners.append(
+            lambda index, name, lock: changes.append((index, lock and lock['owner']))
+        )
+
+        def acquire(index, owner, wait=True):
+            return state_machine.apply(['lock_acquire', {
+                'name': 'lock', 'owner': owner, 'ttl': 10, 'clock': 100 + index, 'wait': wait
+            }], index)
+
+        def release(index, owner):
+            return state_machine.apply([
+                'lock_release', {'name': 'lock', 'owner': owner, 'clock': 100 + index}
+            ], index)
+
+        self.assertEqual(acquire(1, 'a'), {'acquired': True, 'token': 1})
+        self.assertEqual(acquire(2, 'b'), {'acquired': False, 'token': None})
+        self.assertEqual(acquire(3, 'c'), {'acquired': False, 'token': None})
+        self.assertEqual(acquire(4, 'd', wait=False), {'acquired': False, 'token': None})
+
+        # Lease is extended by the holder
+        self.assertEqual(acquire(5, 'a'), {'acquired': True, 'token': 1})
+        self.assertEqual(state_machine.next_expiry(), 115)
+
+        # FIFO: released lock is passed to the first waiter
+        self.assertTrue(release(6, 'a'))
+        self.assertFalse(release(7, 'a'))
+        self.assertEqual(state_machine.locks['lock']['owner'], 'b')
+        self.assertEqual(state_machine.locks['lock']['token'], 6)
+
+        # Expired lease is passed on at the same index on every node
+        restored = StateMachine('127.0.0.1:8000')
+        self.assertEqual(restored.locks['lock']['waiters'], [['c', 10]])
+        restored.apply(['expire', {'clock': 120}], 8)
+        self.assertEqual((restored.locks['lock']['owner'], restored.locks['lock']['token']), ('c', 8))
+
+        restored.apply(['lock_release', {'name': 'lock', 'owner': 'c', 'clock': 121}], 9)
+        self.assertEqual(restored.locks, {})
+        self.assertIsNone(restored.next_expiry())
+        self.assertEqual(changes, [(1, 'a'), (6, 'b')])
+
+
+class TestSQLiteStateMachine(TestStateMachine):
+    backend = SQLiteBackend
+
+
+if __name__ == '__main__':
+    unittest.main()
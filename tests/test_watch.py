@@ -0,0 +1,119 @@
+import asyncio
+import unittest
+
+from raftos.exceptions import CompactedIndexException
+from raftos.watch import ChangeFeed
+
+
+class TestChangeFeed(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.feed = ChangeFeed(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def _collect(self, watch, count):
+        async def collect():
+            changes = []
+            async for change in watch:
+                changes.append((change['index'], change['name'], change['value']))
+            return changes
+
+        async def run():
+            task = self.loop.create_task(collect())
+            await asyncio.sleep(0)
+            for index in range(1, count + 1):
+                self.feed(index, {'user:{}'.format(index): index, 'other': index}, [])
+                await asyncio.sleep(0)
+
+            watch.close()
+            return await task
+
+        return self.loop.run_until_complete(run())
+
+    def test_watch_name(self):
+        self.assertEqual(
+            self._collect(self.feed.watch(name='other'), 3),
+            [(1, 'other', 1), (2, 'other', 2), (3, 'other', 3)]
+        )
+
+    def test_watch_prefix(self):
+        self.assertEqual(
+            self._collect(self.feed.watch(prefix='user:'), 2),
+            [(1, 'user:1', 1), (2, 'user:2', 2)]
+        )
+
+    def test_delete(self):
+        watch = self.feed.watch(name='key')
+        self.feed(1, {}, ['key'])
+        watch.close()
+
+        changes = self.loop.run_until_complete(self._changes(watch))
+        self.assertEqual(changes, [{'index': 1, 'name': 'key', 'value': None, 'deleted': True}])
+
+    def test_resume(self):
+        for index in range(1, 6):
+            self.feed(index, {'key': index}, [])
+
+        watch = self.feed.watch(name='key', start_index=3)
+        watch.close()
+        changes = self.loop.run_until_complete(self._changes(watch))
+        self.assertEqual([change['value'] for change in changes], [4, 5])
+
+    def test_compacted(self):
+        feed = ChangeFeed(self.loop, last_index=10)
+        with self.assertRaises(CompactedIndexException):
+            feed.watch(start_index=5)
+
+        feed.HISTORY_SIZE = 3
+        feed.__init__(self.loop)
+        for index in range(1, 6):
+            feed(index, {'key': index}, [])
+
+        with self.assertRaises(CompactedIndexException):
+            feed.watch(start_index=1)
+
+        watch = feed.watch(start_index=2)
+        watch.close()
+        changes = self.loop.run_until_complete(self._changes(watch))
+        self.assertEqual([change['index'] for change in changes], [3, 4, 5])
+
+    def test_overflow(self):
+        watch = self.feed.watch(name='key')
+        watch.PENDING_SIZE = 3
+        for index in range(1, 6):
+            self.feed(index, {'key': index}, [])
+
+        self.assertNotIn(watch, self.feed.watches)
+        with self.assertRaisesRegex(CompactedIndexException, 'start_index=3'):
+            self.loop.run_until_complete(self._changes(watch))
+
+        self.assertEqual(list(watch.pending), [])
+
+    def test_unregister(self):
+        async def first_change():
+            async with self.feed.watch() as watch:
+                self.feed(1, {'key': 1}, [])
+                async for change in watch:
+                    return change
+
+        self.assertEqual(self.loop.run_until_complete(first_change())['index'], 1)
+        self.assertEqual(len(self.feed.watches), 0)
+
+        # Abandoned without closing
+        watch = self.feed.watch()
+        self.assertEqual(len(self.feed.watches), 1)
+        del watch
+        self.assertEqual(len(self.feed.watches), 0)
+
+    @staticmethod
+    async def _changes(watch):
+        changes = []
+        async for change in watch:
+            changes.append(change)
+        return changes
+
+
+if __name__ == '__main__':
+    unittest.main()